@@ -4,6 +4,65 @@ from fd.pddl.actions import Action
 from fd.pddl.conditions import Truth
 from fd.pddl.effects import Effect
 
+class ActionDelta:
+    """An action schema together with the changes made to it by components.
+    Composing a component only records its change, and the literals of the
+    repaired precondition and effects are computed once when first needed,
+    so no Action is built unless to_action is called.
+    The effects removed by components are removed from the added ones as well."""
+    __slots__ = ("base", "removed_precs", "added_effs", "removed_effs", 
+                 "_precs", "_effs")
+
+    def __init__(self, base, removed_precs=frozenset(), 
+                 added_effs=(), removed_effs=frozenset()):
+        self.base = base
+        self.removed_precs = removed_precs
+        self.added_effs = added_effs
+        self.removed_effs = removed_effs
+        self._precs = None
+        self._effs = None
+
+    @property
+    def name(self):
+        return self.base.name
+
+    @property
+    def parameters(self):
+        return self.base.parameters
+
+    def prec_literals(self):
+        if self._precs is None:
+            lits = (self.base.precondition,)
+            if isinstance(self.base.precondition, Conjunction):
+                lits = self.base.precondition.parts
+            self._precs = [l for l in lits if l not in self.removed_precs]
+        return self._precs
+
+    def eff_literals(self):
+        if self._effs is None:
+            lits = []
+            for eff in self.base.effects:
+                assert(len(eff.parameters) == 0)
+                lits.append(eff.literal)
+            lits.extend(self.added_effs)
+            self._effs = [l for l in lits if l not in self.removed_effs]
+        return self._effs
+
+    def to_action(self):
+        if not (self.removed_precs or self.added_effs or self.removed_effs):
+            return self.base
+        new_prec = self.base.precondition
+        if self.removed_precs:
+            new_prec = Conjunction(self.prec_literals())
+        new_effs = [eff for eff in self.base.effects 
+                    if eff.literal not in self.removed_effs]
+        for atom in self.added_effs:
+            if atom not in self.removed_effs:
+                new_effs.append(Effect([], Truth(), atom))
+        return Action(self.base.name, self.base.parameters, 
+                      self.base.num_external_parameters, new_prec, 
+                      new_effs, self.base.cost)
+
 class Component:
     def __init__(self, action_name, atom):
         self.action_name = action_name
@@ -22,6 +81,9 @@ class Component:
     def apply(self, action):
         pass
 
+    def compose(self, delta):
+        pass
+
 class CompPrec(Component):
     def __str__(self):
         return "<Component: Remove {} from Precondition: {} | Condition: {}>".format(self.atom, self.action_name, self.is_condition)
@@ -39,6 +101,11 @@ class CompPrec(Component):
         new_prec = Conjunction(new_lits)
         return Action(action.name, action.parameters, action.num_external_parameters, new_prec, action.effects, action.cost)
 
+    def compose(self, delta):
+        assert(self.action_name == delta.name)
+        return ActionDelta(delta.base, delta.removed_precs | {self.atom}, 
+                           delta.added_effs, delta.removed_effs)
+
 class CompEffAdd(Component):
     def __str__(self):
         return "<Component: Add {} to Effects: {} | Condition: {}>".format(self.atom, self.action_name, self.is_condition)
@@ -50,6 +117,11 @@ class CompEffAdd(Component):
         new_effs.append(new_eff)
         return Action(action.name, action.parameters, action.num_external_parameters, action.precondition, new_effs, action.cost)
 
+    def compose(self, delta):
+        assert(self.action_name == delta.name)
+        return ActionDelta(delta.base, delta.removed_precs, 
+                           delta.added_effs + (self.atom,), delta.removed_effs)
+
     def negate(self):
         return {CompEffDel(self.action_name, self.atom), CompEffAdd(self.action_name, self.atom.negate())}
 
@@ -65,5 +137,28 @@ class CompEffDel(Component):
             new_effs.append(eff)
         return Action(action.name, action.parameters, action.num_external_parameters, action.precondition, new_effs, action.cost)
 
+    def compose(self, delta):
+        assert(self.action_name == delta.name)
+        return ActionDelta(delta.base, delta.removed_precs, 
+                           delta.added_effs, delta.removed_effs | {self.atom})
+
     def negate(self):
         return {CompEffAdd(self.action_name, self.atom), CompEffDel(self.action_name, self.atom.negate())}
+
+
+class CostModel:
+    def __init__(self, prec_cost=1, add_eff_cost=1, del_eff_cost=1,
+                 action_costs=None, predicate_costs=None):
+        """The cost of a component is the cost of its type, multiplied by
+        the factors of its target action and of the predicate of its atom
+        (1 if not given)"""
+        self.type_costs = {CompPrec: prec_cost,
+                           CompEffAdd: add_eff_cost,
+                           CompEffDel: del_eff_cost}
+        self.action_costs = action_costs or {}
+        self.predicate_costs = predicate_costs or {}
+
+    def cost(self, comp):
+        return (self.type_costs[comp.__class__]
+                * self.action_costs.get(comp.action_name, 1)
+                * self.predicate_costs.get(comp.atom.predicate, 1))
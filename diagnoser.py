@@ -1,71 +1,208 @@
 import memhitter
+import maxsathitter
 import options
-import resource
 import time
 import os
+from dataclasses import dataclass
+from typing import List, Optional, Set
+from component import ActionDelta, Component, CostModel
 from system import System
 
+@dataclass
+class Result:
+    diagnoses: List[Set[Component]] # diagnoses found, in the order of their weights
+    complete: bool # False if the search ran out of budget
+    # the checked candidate that the fewest tasks failed, if the search ran out of budget
+    best: Optional[Set[Component]] = None
+    # lower bound on the weight of the diagnoses that were not found
+    lower_bound: float = 0
+
+# hitters by their names, they all have the interface of memhitter.Hitter
+HITTERS = {
+    "mem": memhitter.Hitter,
+    "maxsat": maxsathitter.Hitter,
+}
+
 class Diagnoser:
-    def __init__(self, system):
+    def __init__(self, system, time_budget=None, memory_budget=None, cost_model=None,
+                 hitter="mem", batch_size=1):
+        '''
+          time_budget is in seconds of wall-clock time 
+          and memory_budget in MB of peak memory, 
+          including the worker processes of the system (see System.peak_memory); 
+          no budget is enforced if they are None.
+          cost_model gives the weights of the components (1 by default).
+          hitter is the name of the hitter in HITTERS.
+          batch_size is the number of candidates given by the hitter
+          that are checked together in each iteration.
+        '''
         self.system = system
         self.idx_to_comp, self.comp_to_idx = {}, {}
+        self.cost_model = cost_model or CostModel()
+        # weights of the components by their indices, the index 0 is unused
+        self.weights = [None]
+        self.time_budget = time_budget
+        self.memory_budget = memory_budget
+        self.hitter = HITTERS[hitter]
+        self.batch_size = batch_size
+
+    def out_of_budget(self):
+        if (self.time_budget is not None 
+                and time.monotonic() - self._start_time > self.time_budget):
+            return True
+        if self.memory_budget is not None:
+            if self.system.peak_memory() > self.memory_budget:
+                return True
+        return False
 
     def diagnosis(self):
-        hitter = memhitter.Hitter()
-        while True:
-            candidate = hitter.top()
-            candidate = set(self.idx_to_comp[x] for x in candidate)
-            infos = self.system.is_diagnosis(candidate)
-            if infos.result:
-                return candidate
-            confs = self.system.find_conflict(candidate, infos)
-            for conf in confs:
-                conflict = []
-                for c in conf:
-                    if c not in self.comp_to_idx:
-                        idx = len(self.comp_to_idx) + 1
-                        self.comp_to_idx[c] = idx
-                        self.idx_to_comp[idx] = c
-                    if c.is_condition:
-                        conflict.append(-self.comp_to_idx[c])
-                    else:
-                        conflict.append(self.comp_to_idx[c])
-                hitter.add_conflict(conflict)
+        '''
+          Returns a diagnosis of the lowest weight, or None if no diagnosis 
+          exists or none was found within the budget (see search).
+        '''
+        ds = self.diagnoses(1)
+        return ds[0] if ds else None
 
+    def diagnoses(self, k):
+        return self.search(k).diagnoses
+
+    def search(self, k):
+        '''
+          Searches the (at most) k diagnoses of the lowest weights, 
+          in the order of their weights, found by the same hitter.
+          Once a diagnosis is found, the hitter is given a conflict
+          forbidding the diagnosis and all its supersets.
+          If the budget is exhausted, the search stops and the result 
+          holds the diagnoses found so far, the best candidate checked 
+          and the lower bound of the hitter.
+          Only the first candidate of a batch can be a diagnosis found, 
+          the others only give conflicts (or are found later, when they 
+          are the first of a batch, without being simulated again).
+        '''
+        self._start_time = time.monotonic()
+        hitter = self.hitter(out_of_budget=self.out_of_budget)
+        # components only get indices before they appear in the hitter, 
+        # so extending the list of weights keeps the search optimal
+        hitter.set_weights(self.weights)
+        found = []
+        best, best_failures = None, None
+        while len(found) < k:
+            try:
+                if self.out_of_budget():
+                    raise memhitter.OutOfBudget()
+                batch = hitter.top_n(self.batch_size)
+            except memhitter.OutOfBudget:
+                return Result(found, False, best, hitter.lower_bound())
+            if not batch:
+                break
+            candidates = [set(self.idx_to_comp[x] for x in idxs) for idxs in batch]
+            batch_infos = self.system.is_diagnosis_batch(candidates)
+            for i, (candidate, infos) in enumerate(zip(candidates, batch_infos)):
+                if infos.result:
+                    if i == 0:
+                        found.append(candidate)
+                        hitter.add_conflict([-x for x in batch[0]])
+                    continue
+                failures = sum(1 for info in infos.infos 
+                               if info is not None and not info.result)
+                if best is None or failures < best_failures:
+                    best, best_failures = candidate, failures
+                self.add_conflicts(hitter, candidate, infos)
+        return Result(found, True, lower_bound=hitter.lower_bound())
     
+    def add_conflicts(self, hitter, candidate, infos):
+        '''
+          Gives the hitter the conflicts of a candidate that is not a diagnosis.
+        '''
+        confs = self.system.find_conflict(candidate, infos)
+        for conf in confs:
+            conflict = []
+            for c in conf:
+                if c not in self.comp_to_idx:
+                    idx = len(self.comp_to_idx) + 1
+                    self.comp_to_idx[c] = idx
+                    self.idx_to_comp[idx] = c
+                    self.weights.append(self.cost_model.cost(c))
+                if c.is_condition:
+                    conflict.append(-self.comp_to_idx[c])
+                else:
+                    conflict.append(self.comp_to_idx[c])
+            hitter.add_conflict(conflict)
+
+def cpu_time():
+    # the CPU time of this process and of its terminated children, 
+    # which include the worker processes once the system is closed
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
 if __name__ == "__main__":
-    start_time = time.process_time()
-    syt = System(options.domain, options.tasks, options.plans) 
-    diagnoser = Diagnoser(syt)
-    d = diagnoser.diagnosis()
-    end_time = time.process_time()
-    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = cpu_time()
+    syt = System(options.domain, options.tasks, 
+                 options.plans, options.num_workers, 
+                 options.max_failures, options.all_conflicts, 
+                 options.max_states, options.max_cached) 
+    cost_model = CostModel(options.prec_cost, options.add_eff_cost, 
+                           options.del_eff_cost, dict(options.action_costs), 
+                           dict(options.predicate_costs))
+    diagnoser = Diagnoser(syt, options.time_budget, 
+                          options.memory_budget, cost_model, options.hitter, 
+                          options.batch_size)
+    result = diagnoser.search(options.num_diagnoses)
+    ds = result.diagnoses
+    peak = syt.peak_memory()
+    syt.close()
+    end_time = cpu_time()
     if (options.evaluation
             and options.out_diagnosis is None):
         print("An output file for writting the dignosis " 
               "is required in the evaluation mode")
+    if not result.complete:
+        print("Out of budget, lower bound on the weight "
+              "of the next diagnosis: {}".format(result.lower_bound))
+        if options.print and result.best is not None:
+            print("Best candidate so far:")
+            for c in result.best:
+                print(c)
+            print()
+    elif not ds:
+        print("No diagnosis exists")
     if options.print:
-        for c in d:
-            print(c)
+        for i, d in enumerate(ds):
+            if i > 0:
+                print()
+            for c in d:
+                print(c)
     if options.out_diagnosis is not None:
         out_file = os.path.join(
                 options.out_diagnosis,
                 "diagnosis")
         with open(out_file, "w") as f:
-            for c in d:
-                f.write(str(c) + "\n")
+            for i, d in enumerate(ds):
+                if i > 0:
+                    f.write("\n")
+                for c in d:
+                    f.write(str(c) + "\n")
             if options.evaluation:
                 elapsed_time = end_time - start_time
                 f.write(str(elapsed_time) + "\n")
-                f.write("memory: {}".format(float(peak/1024)))
+                f.write("memory: {}".format(peak))
     if options.out_domain is not None:
-        out_file = os.path.join(
-                options.out_domain,
-                "domain-repaired.pddl")
         task = syt.get_task()
-        for idx, a in enumerate(task.actions):
-            for c in d:
-                if a.name == c.action_name:
-                    task.actions[idx] = c.apply(task.actions[idx])
-        with open(out_file, "w") as f:
-            f.write(task.domain())
\ No newline at end of file
+        actions = list(task.actions)
+        for i, d in enumerate(ds):
+            # the domain repaired by the i-th diagnosis (from 0)
+            # is written to domain-repaired-i.pddl for i > 0
+            name = "domain-repaired.pddl"
+            if i > 0:
+                name = "domain-repaired-{}.pddl".format(i)
+            out_file = os.path.join(options.out_domain, name)
+            task.actions = []
+            for a in actions:
+                # the repaired actions are only built as Action objects here
+                delta = ActionDelta(a)
+                for c in d:
+                    if a.name == c.action_name:
+                        delta = c.compose(delta)
+                task.actions.append(delta.to_action())
+            with open(out_file, "w") as f:
+                f.write(task.domain())
\ No newline at end of file
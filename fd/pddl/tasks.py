@@ -41,8 +41,14 @@ class Task(object):
 
     @staticmethod
     def parse(domain_pddl, task_pddl):
+        return Task.parse_with_domain(tuple(parse_domain(domain_pddl)), task_pddl)
+
+    @staticmethod
+    def parse_with_domain(domain, task_pddl):
+        # domain is an already parsed domain, as given by parse_domain,
+        # so that it can be shared by several tasks
         domain_name, domain_requirements, types, constants, predicates, functions, actions, axioms \
-                     = parse_domain(domain_pddl)
+                     = domain
         task_name, task_domain_name, task_requirements, objects, init, goal, use_metric = parse_task(task_pddl)
 
         assert domain_name == task_domain_name
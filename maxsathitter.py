@@ -0,0 +1,179 @@
+from typing import Callable, FrozenSet, Iterator, List, Optional, Tuple
+
+from memhitter import OutOfBudget, to_bits, iter_bits, from_bits
+
+class Hitter:
+    '''
+    Alternative to memhitter.Hitter, with the same interface,
+    that solves the hitting set problem as a weighted partial MaxSAT problem.
+    Each element e is a Boolean variable of weight w(e);
+    each conflict is a hard clause whose positive elements are positive literals
+    and whose negative elements -e are negative literals;
+    the weight of the variables set to true is minimised by branch and bound.
+    Only the last solution is kept between searches: since conflicts are only added,
+    the weight of the optimal solution never decreases,
+    so the last solution is returned again as long as it hits all conflicts,
+    and a new search stops as soon as it finds a solution of the last optimal weight;
+    nothing else is learnt, each search starts again from the empty assignment.
+    '''
+    def __init__(self, out_of_budget: Optional[Callable[[], bool]] = None):
+        '''
+        out_of_budget is called periodically by top,
+        which raises OutOfBudget if it returns True.
+        '''
+        self._out_of_budget = out_of_budget
+        self._clauses = [] # pairs of masks of the positive and negative elements
+        self._weights = []
+        self._solution = 0 # bitset of the elements of the last solution, None if unknown
+        self._lb = 0 # weight of the last solution, a lower bound on the next one
+        self._unsat = False
+
+    def set_weights(self, weights: List[float]) -> None:
+        '''
+        Same as memhitter.Hitter.set_weights.
+        '''
+        self._weights = weights
+
+    def reset_weights(self, weights: List[float]) -> None:
+        # the last solution may not be optimal for the new weights
+        self._weights = weights
+        self._solution = None
+        self._lb = 0
+
+    def weight(self, e: int) -> float:
+        '''
+          Returns the weight of element e.  Default value is 1.
+        '''
+        if e < len(self._weights):
+            return self._weights[e]
+        return 1
+
+    def lower_bound(self) -> float:
+        '''
+          Returns a lower bound on the weight of the sets
+          that top can still return.
+        '''
+        if self._unsat:
+            return float("inf")
+        return self._lb
+
+    def add_conflict(self, conflict: List[int]) -> None:
+        self._clauses.append((
+            to_bits(e for e in conflict if e > 0),
+            to_bits(-e for e in conflict if e < 0)))
+
+    def satisfies(self, set: int) -> bool:
+        for pos, neg in self._clauses:
+            if not (pos & set or neg & ~set):
+                return False
+        return True
+
+    def top(self) -> Optional[FrozenSet[int]]:
+        '''
+          Returns a set of minimal weight hitting all conflicts,
+          or None if there is none.
+        '''
+        if self._unsat:
+            return None
+        if self._solution is not None and self.satisfies(self._solution):
+            return from_bits(self._solution)
+        self._best, self._best_weight = None, float("inf")
+        self._nb_nodes = 0
+        self.search()
+        if self._best is None:
+            self._unsat = True
+            return None
+        self._solution, self._lb = self._best, self._best_weight
+        return from_bits(self._solution)
+
+    def top_n(self, n: int) -> List[FrozenSet[int]]:
+        '''
+          Returns (at most) n sets hitting all conflicts, the first of which 
+          is the one returned by top, in the order of their weights.
+          Each set is of minimal weight among the sets 
+          that do not contain one of the previous sets.
+        '''
+        top = self.top()
+        if top is None:
+            return []
+        tops = [top]
+        # the solution of top is kept for the next calls, 
+        # the temporary conflicts and the solutions they lead to are not
+        num_clauses = len(self._clauses)
+        state = (self._solution, self._lb, self._unsat)
+        try:
+            while len(tops) < n:
+                # temporarily forbidding the last set and its supersets
+                self.add_conflict([-e for e in tops[-1]])
+                top = self.top()
+                if top is None:
+                    break
+                tops.append(top)
+        finally:
+            del self._clauses[num_clauses:]
+            self._solution, self._lb, self._unsat = state
+        return tops
+
+    def search(self) -> None:
+        '''
+          Explores the partial assignments depth first from the empty one,
+          with an explicit stack of the branches still to be explored 
+          so that the depth is not bounded by the recursion limit.
+        '''
+        stack = [self.branches(0, 0, 0)]
+        while stack:
+            branch = next(stack[-1], None)
+            if branch is None:
+                stack.pop()
+            else:
+                stack.append(self.branches(*branch))
+
+    def branches(self, true: int, false: int, 
+                 weight: float) -> Iterator[Tuple[int, int, float]]:
+        '''
+          Explores the partial assignment where the elements in true
+          are chosen and those in false are not, 
+          and yields its branches to be explored in turn by search 
+          (each one is explored before the next one is yielded).
+        '''
+        self._nb_nodes += 1
+        if (self._out_of_budget is not None
+                and self._nb_nodes % 1024 == 0
+                and self._out_of_budget()):
+            raise OutOfBudget()
+        # the lower bound packs disjoint clauses that can only be
+        # satisfied by choosing one more element
+        bound, used = weight, 0
+        branch, branch_size = None, None
+        for pos, neg in self._clauses:
+            if pos & true or neg & false:
+                continue
+            free_pos, free_neg = pos & ~false, neg & ~true
+            size = free_pos.bit_count() + free_neg.bit_count()
+            if size == 0:
+                return
+            if branch is None or size < branch_size:
+                branch, branch_size = (free_pos, free_neg), size
+            if not free_neg and not free_pos & used:
+                used |= free_pos
+                bound += min(self.weight(e) for e in iter_bits(free_pos))
+        if branch is None:
+            if weight < self._best_weight:
+                self._best, self._best_weight = true, weight
+            return
+        if bound >= self._best_weight:
+            return
+        # branching on the literals of the smallest clause,
+        # the literals of the previous branches are made false
+        free_pos, free_neg = branch
+        for e in iter_bits(free_neg):
+            yield true, false | (1 << e), weight
+            if self._best_weight <= self._lb:
+                return
+            true |= 1 << e
+            weight += self.weight(e)
+        for e in sorted(iter_bits(free_pos), key=self.weight):
+            yield true | (1 << e), false, weight + self.weight(e)
+            if self._best_weight <= self._lb:
+                return
+            false |= 1 << e
@@ -1,78 +1,205 @@
-from queue import PriorityQueue
+import heapq
 
-from typing import FrozenSet, List, Set
+from typing import Callable, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass
 
-def hits(set: FrozenSet[int], list: List[int]):
-    for e in list:
-        if e in set:
-            return True
-    return False
+# Sets of elements are encoded as bitsets: element e is in the set iff bit e is set.
+
+def to_bits(elements: List[int]) -> int:
+    bits = 0
+    for e in elements:
+        bits |= 1 << e
+    return bits
+
+def iter_bits(bits: int) -> Iterator[int]:
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def from_bits(bits: int) -> FrozenSet[int]:
+    return frozenset(iter_bits(bits))
 
-@dataclass
+def lowest(bits: int) -> int:
+    return (bits & -bits).bit_length() - 1
+
+class OutOfBudget(Exception):
+    pass
+
+@dataclass(slots=True)
 class HittingObject(): 
     weight: float
-    set: FrozenSet[int]
-    forbiddens: Set[int] # objects that are not allowed to be chosen
+    set: int
+    forbiddens: int # objects that are not allowed to be chosen
     bc: int
     cc: int
     id: int # used to break ties
+    # Lower bound on the weight still to be added to the set: 
+    # the positions of pairwise disjoint basic conflicts not hit by the set, 
+    # chosen among the first known_h conflicts, the union of their elements,
+    # and the sum of the lowest weight of an element in each of them
+    packed: int = 0
+    used: int = 0
+    known_h: int = 0
+    h: float = 0
 
-    def __lt__(self, other):
-        # want weight to be as low as possible
-        if other.weight > self.weight:
-            return True
-        if other.weight < self.weight:
-            return False
-        # want bc as high as possible
-        if other.bc < self.bc:
-            return True
-        if other.bc > self.bc:
-            return False
-        # want cc as high as possible
-        if other.cc < self.bc:
-            return True
-        if other.cc > self.bc:
-            return False
-        return other.id > self.id
+    def key(self) -> Tuple[float, int, int, int]:
+        # want weight plus lower bound to be as low as possible, 
+        # then bc and cc as high as possible
+        return (self.weight + self.h, -self.bc, -self.cc, self.id)
 
-    def forbid(self, forbs: List[int]) -> None:
-        for f in forbs:
-            self.forbiddens.add(f)
+    def forbid(self, forbs: int) -> None:
+        self.forbiddens |= forbs
 
 class Hitter:
-    def __init__(self):
-        self._queue = PriorityQueue() # Will contain the HitterObjects
+    def __init__(self, max_visited: int = 1 << 18, 
+                 out_of_budget: Optional[Callable[[], bool]] = None):
+        '''
+        max_visited bounds the number of entries in the table 
+        used for detecting duplicate objects; the table is cleared 
+        when it is full.
+        out_of_budget is called periodically by top, 
+        which raises OutOfBudget if it returns True.
+        '''
+        self._out_of_budget = out_of_budget
+        self._frontier = [] # Will contain the HitterObjects, as a heap of (key, object) pairs
+        self._visited = {} # Maps the sets of the objects pushed so far to their forbiddens
+        self._max_visited = max_visited
         self._nb_objects = -1
-        self._queue.put(self.create_object(None,None))
         self._basic_conflicts = []
+        self._basic_masks = []
+        self._basic_costs = [] # lowest weight of an element of each basic conflict
         self._complex_conflicts = []
+        self._complex_masks = [] # masks of the negative elements of complex conflicts
+        # Bitsets of the positions of the conflicts that have not been removed
+        self._live_bc = 0
+        self._live_cc = 0
+        # Inverted index: maps each element to the bitset of the positions of 
+        # the basic conflicts (resp. of the complex conflicts as a positive element) 
+        # containing it
+        self._bc_of = {}
+        self._cc_of = {}
+        # Maps each (signed) element to the conflicts containing it;
+        # conflicts are identified by (is_complex, position) pairs.
+        self._index = {}
+        self._elements = {} # Maps the conflicts to their sets of elements
+        # Each conflict is also watched by one of its elements, 
+        # which is only used for detecting subsumed conflicts
+        self._watch_of = {}
+        self._watched = {}
         self._weights = []
+        self.push(self.create_object(None,None))
 
     def create_object(self, ho: HittingObject, new_element: int):
         if ho == None:
             w = 0
-            new_set = set()
-            forbiddens = set()
+            new_set = 0
+            forbiddens = 0
             bc = 0
             cc = 0
+            packed, used, known_h, h = 0, 0, 0, 0
         else:
             w = ho.weight + self.weight(new_element)
-            new_set = { e for e in ho.set }
-            new_set.add(new_element)
-            forbiddens = { e for e in ho.forbiddens }
+            new_set = ho.set | (1 << new_element)
+            forbiddens = ho.forbiddens
             bc = ho.bc
             cc = 0
+            # the packed conflicts hit by the new element are unpacked
+            packed, used, known_h, h = ho.packed, ho.used, ho.known_h, ho.h
+            removed = packed & self._bc_of.get(new_element, 0)
+            if removed:
+                for position in iter_bits(removed):
+                    used &= ~self._basic_masks[position]
+                    h -= self._basic_costs[position]
+                packed &= ~removed
 
         self._nb_objects += 1
         return HittingObject(weight=w, 
-            set=frozenset(new_set), 
+            set=new_set, 
             forbiddens=forbiddens,
             bc=bc, 
             cc=cc, 
             id=self._nb_objects, 
+            packed=packed,
+            used=used,
+            known_h=known_h,
+            h=h,
         )
 
+    def update_bound(self, obj: HittingObject, hit_bc: int) -> bool:
+        '''
+          Greedily packs the basic conflicts added since the lower bound 
+          of obj was last computed, if they are not hit and disjoint 
+          from the packed ones.  
+          Each packed conflict needs its own element to be hit, 
+          so the bound is admissible.  
+          Returns True if the bound increased.
+          hit_bc is the bitset of the basic conflicts hit by obj.
+        '''
+        n = len(self._basic_conflicts)
+        if obj.known_h == n:
+            return False
+        h = obj.h
+        pending = (self._live_bc & ~hit_bc) >> obj.known_h << obj.known_h
+        for position in iter_bits(pending):
+            mask = self._basic_masks[position]
+            if not mask & obj.used:
+                obj.used |= mask
+                obj.packed |= 1 << position
+                obj.h += self._basic_costs[position]
+        obj.known_h = n
+        return obj.h > h
+
+    def hits(self, set: int, conflicts_of: Dict[int, int]) -> int:
+        '''
+          Returns the bitset of the positions of the conflicts hit by set, 
+          i.e., the union of the bitsets of the conflicts containing 
+          its elements given by the inverted index conflicts_of.  
+          The hits are computed when an object reaches the top of the frontier 
+          rather than stored in each object, as they grow with the conflicts.
+        '''
+        hit = 0
+        for e in iter_bits(set):
+            hit |= conflicts_of.get(e, 0)
+        return hit
+
+    def expand(self, obj: HittingObject, conflict: List[int]) -> None:
+        '''
+          Replaces obj in the frontier by its children, 
+          each of which hits the conflict with a different element.
+        '''
+        heapq.heappop(self._frontier)
+        forbs = 0
+        for e in conflict:
+            if e < 0:
+                continue
+            if not obj.forbiddens >> e & 1:
+                new_object = self.create_object( obj,e )
+                new_object.forbid(forbs)
+                self.push(new_object)
+            forbs |= 1 << e
+
+    def push(self, obj: HittingObject) -> None:
+        if self.is_duplicate(obj):
+            return
+        heapq.heappush(self._frontier, (obj.key(), obj))
+
+    def is_duplicate(self, obj: HittingObject) -> bool:
+        '''
+          Decides whether an object with the same set was already pushed 
+          with a subset of the forbiddens of obj.  
+          Every hitting set that can be reached from obj can then also be 
+          reached from that object (or from its children if it was expanded), 
+          so obj can be dropped.
+        '''
+        forbiddens = self._visited.get(obj.set)
+        if forbiddens is not None and forbiddens & ~obj.forbiddens == 0:
+            return True
+        if len(self._visited) >= self._max_visited:
+            self._visited.clear()
+        self._visited[obj.set] = obj.forbiddens
+        return False
+
     def set_weights(self, weights: List[float]) -> None:
         '''
         Sets the weights of the elements.  
@@ -91,16 +218,19 @@ class Hitter:
         self._weights = weights
 
     def reset_weights(self, weights: List[float]) -> None:
-        objects = []
-        while not self._queue.empty():
-            objects.append(self._queue.get())
         self._weights = weights
+        self._basic_costs = [min(self.weight(e) for e in conflict) if conflict else 0
+                             for conflict in self._basic_conflicts]
+        objects = [obj for _, obj in self._frontier]
         for obj in objects:
             w = 0
-            for e in obj.set:
+            for e in from_bits(obj.set):
                 w += self.weight(e)
             obj.weight = w
-            self._queue.put(obj)
+            # the lower bound is computed again from scratch
+            obj.packed, obj.used, obj.known_h, obj.h = 0, 0, 0, 0
+        self._frontier = [(obj.key(), obj) for obj in objects]
+        heapq.heapify(self._frontier)
 
     def weight(self, e: int) -> float:
         '''
@@ -110,76 +240,165 @@ class Hitter:
             return self._weights[e]
         return 1
 
-    def top(self) -> Set[int]:
+    def top(self) -> FrozenSet[int]:
         '''
           Returns the top element in this hitter.
           The element is *not* removed from the queue.
         '''
-        while True:
-            obj: HittingObject = self._queue.get()
-
-            while obj.bc < len(self._basic_conflicts): # Deal with all basic conflicts
-                conflict = self._basic_conflicts[obj.bc]
-                if hits(obj.set, conflict):
-                    # already hits this conflict
-                    obj.bc += 1
-                    continue
-                # needs to hit the conflict
-                forbs = []
-                for e in conflict:
-                    if e not in obj.forbiddens:
-                        new_object = self.create_object( obj,e )
-                        new_object.forbid(forbs)
-                        self._queue.put(new_object)
-                    forbs.append(e)
-                break
-                
-            if obj.bc != len(self._basic_conflicts):
+        nb_iterations = 0
+        while self._frontier:
+            nb_iterations += 1
+            if (self._out_of_budget is not None 
+                    and nb_iterations % 1024 == 0
+                    and self._out_of_budget()):
+                raise OutOfBudget()
+            # the object is only popped if it needs to be expanded
+            obj: HittingObject = self._frontier[0][1]
+            hit_bc = self.hits(obj.set, self._bc_of)
+            if self.update_bound(obj, hit_bc):
+                # the key of obj increased, it needs to be reinserted
+                heapq.heapreplace(self._frontier, (obj.key(), obj))
                 continue
 
+            # Deal with all basic conflicts
+            pending = self._live_bc & ~hit_bc
+            if pending:
+                # needs to hit the first conflict it does not hit
+                obj.bc = lowest(pending)
+                self.expand(obj, self._basic_conflicts[obj.bc])
+                continue
+            obj.bc = len(self._basic_conflicts)
+
             # Dealing with non-basic conflicts
-            while obj.cc < len(self._complex_conflicts):
-                conflict = self._complex_conflicts[obj.cc]
-                applicable = True
-                for e in conflict:
-                    if e > 0:
-                        continue
-                    if -e not in obj.set:
-                        applicable = False
-                        break
-                if not applicable:
-                    obj.cc += 1
-                    continue
+            hit_cc = self.hits(obj.set, self._cc_of)
+            pending = (self._live_cc & ~hit_cc) >> obj.cc << obj.cc
+            while pending:
+                position = lowest(pending)
+                neg_mask = self._complex_masks[position]
+                if obj.set & neg_mask == neg_mask:
+                    break
+                # the conflict is not applicable
+                pending ^= 1 << position
+            if pending:
                 # Need to hit the conflict
-                forbs = []
-                for e in conflict:
-                    if e < 0:
-                        continue
-                    if e not in obj.forbiddens:
-                        new_object = self.create_object( obj,e )
-                        new_object.forbid(forbs)
-                        self._queue.put(new_object)
-                    forbs.append(e)
-                break
-            
-            if obj.cc == len(self._complex_conflicts):
-                self._queue.put(obj)
-                return obj.set
+                obj.cc = position
+                self.expand(obj, self._complex_conflicts[obj.cc])
+                continue
+            obj.cc = len(self._complex_conflicts)
+
+            # bc and cc only increased, so the object's key decreased 
+            # and it remains on top of the heap
+            self._frontier[0] = (obj.key(), obj)
+            return from_bits(obj.set)
 
         return None
 
+    def top_n(self, n: int) -> List[FrozenSet[int]]:
+        '''
+          Returns (at most) n sets in the frontier hitting all conflicts,
+          the first of which is the top element, in the order of their weights.
+          A set is skipped if it contains one of the previous sets.
+          The elements are *not* removed from the queue.
+        '''
+        tops, popped = [], []
+        try:
+            while len(tops) < n:
+                top = self.top()
+                if top is None:
+                    break
+                popped.append(heapq.heappop(self._frontier))
+                if not any(t <= top for t in tops):
+                    tops.append(top)
+        finally:
+            for item in popped:
+                heapq.heappush(self._frontier, item)
+        return tops
+
+    def lower_bound(self) -> float:
+        '''
+          Returns a lower bound on the weight of the sets 
+          that top can still return.
+        '''
+        if not self._frontier:
+            return float("inf")
+        return self._frontier[0][0][0]
+
     def add_conflict(self, conflict: List[int]) -> None:
-        for e in conflict:
-            if e < 0:
-                self._complex_conflicts.append(conflict)
+        '''
+          Adds a conflict unless it is subsumed by a known conflict,
+          and removes the known conflicts that it subsumes.
+          A conflict subsumes another if its (signed) elements are a subset
+          of the other's: every set hitting the former then hits the latter.
+        '''
+        elements = set(conflict)
+        if self.is_subsumed(elements):
+            return
+        self.remove_subsumed(elements)
+        is_complex = any(e < 0 for e in conflict)
+        if is_complex:
+            position = len(self._complex_conflicts)
+            self._complex_conflicts.append(conflict)
+            self._complex_masks.append(to_bits(-e for e in conflict if e < 0))
+            self._live_cc |= 1 << position
+            conflicts_of = self._cc_of
+        else:
+            position = len(self._basic_conflicts)
+            self._basic_conflicts.append(conflict)
+            self._basic_masks.append(to_bits(conflict))
+            self._basic_costs.append(min(self.weight(e) for e in conflict) if conflict else 0)
+            self._live_bc |= 1 << position
+            conflicts_of = self._bc_of
+        for e in elements:
+            if e > 0:
+                conflicts_of[e] = conflicts_of.get(e, 0) | (1 << position)
+        cid = (is_complex, position)
+        self._elements[cid] = frozenset(elements)
+        for e in elements:
+            self._index.setdefault(e, set()).add(cid)
+        # the conflict is watched by its element in the fewest conflicts
+        if elements:
+            e = min(elements, key=lambda e: len(self._index[e]))
+            self._watch_of[cid] = e
+            self._watched.setdefault(e, set()).add(cid)
+
+    def conflict(self, cid: Tuple[bool, int]) -> List[int]:
+        is_complex, position = cid
+        if is_complex:
+            return self._complex_conflicts[position]
+        return self._basic_conflicts[position]
+
+    def is_subsumed(self, elements: Set[int]) -> bool:
+        # a conflict that is a subset of elements is watched by one of them
+        for e in elements:
+            for cid in self._watched.get(e, ()):
+                if self._elements[cid] <= elements:
+                    return True
+        return False
+
+    def remove_subsumed(self, elements: Set[int]) -> None:
+        if not elements:
+            return
+        cids = None
+        for e in sorted(elements, key=lambda e: len(self._index.get(e, ()))):
+            if cids is None:
+                cids = set(self._index.get(e, ()))
+            else:
+                cids &= self._index.get(e, set())
+            if not cids:
                 return
-        self._basic_conflicts.append(conflict)
+        for cid in cids:
+            for e in self._elements.pop(cid):
+                self._index[e].discard(cid)
+            self._watched[self._watch_of.pop(cid)].discard(cid)
+            is_complex, position = cid
+            if is_complex:
+                self._live_cc &= ~(1 << position)
+            else:
+                self._live_bc &= ~(1 << position)
 
     def DEBUG_PRINT(self):
-        while not self._queue.empty():
-            e = self._queue.get()
+        for _, e in sorted(self._frontier):
             print(e)
-        print(self._sets)     
 
 
 if __name__ == '__main__':
@@ -2,6 +2,11 @@ import argparse
 import sys
 
 
+def cost_pair(arg):
+    name, cost = arg.rsplit("=", 1)
+    return name, float(cost)
+
+
 def parse_args():
     argparser = argparse.ArgumentParser()
     argparser.add_argument(
@@ -25,6 +30,60 @@ def parse_args():
     argparser.add_argument(
             "--print", action="store_true", default=False,
             help="print the found diagnosis")
+    argparser.add_argument(
+            "--num_diagnoses", "--num-diagnoses", type=int, default=1,
+            help="number of diagnoses of the lowest weights to be found")
+    argparser.add_argument(
+            "--prec_cost", type=float, default=1,
+            help="cost of removing an atom from a precondition")
+    argparser.add_argument(
+            "--add_eff_cost", type=float, default=1,
+            help="cost of adding an effect")
+    argparser.add_argument(
+            "--del_eff_cost", type=float, default=1,
+            help="cost of removing an effect")
+    argparser.add_argument(
+            "--action_costs", nargs="+", type=cost_pair, default=[],
+            metavar="ACTION=FACTOR",
+            help="factors of the costs of repairing the given actions")
+    argparser.add_argument(
+            "--predicate_costs", nargs="+", type=cost_pair, default=[],
+            metavar="PREDICATE=FACTOR",
+            help="factors of the costs of repairing atoms of the given predicates")
+    argparser.add_argument(
+            "--time_budget", type=float,
+            help="wall-clock time budget of the search in seconds")
+    argparser.add_argument(
+            "--memory_budget", type=float,
+            help="peak memory budget of the search in MB, "
+                 "summed over the main and worker processes")
+    argparser.add_argument(
+            "--num_workers", type=int, default=1,
+            help="number of worker processes checking the tasks in parallel")
+    argparser.add_argument(
+            "--max_failures", type=int, default=0,
+            help=("stop checking a candidate after this many tasks "
+                  "have failed (0 for checking all tasks)"))
+    argparser.add_argument(
+            "--max_states", type=int, default=1 << 19,
+            help=("number of simulated states kept for reusing the prefixes "
+                  "of the plans, shared by all tasks"))
+    argparser.add_argument(
+            "--max_cached", type=int, default=4096,
+            help=("number of repaired actions, and of results and conflicts "
+                  "of candidates per task, kept in the caches of the simulator"))
+    argparser.add_argument(
+            "--all_conflicts", action="store_true", default=False,
+            help=("compute a conflict for every unsatisfied precondition and goal "
+                  "of a failing plan instead of only the first one"))
+    argparser.add_argument(
+            "--batch_size", type=int, default=1,
+            help=("number of the best candidates of the hitter "
+                  "that are checked together in each iteration"))
+    argparser.add_argument(
+            "--hitter", choices=["mem", "maxsat"], default="mem",
+            help=("hitting set solver: the best-first search of memhitter "
+                  "or the branch and bound MaxSAT solver of maxsathitter"))
     return argparser.parse_args()
 
 
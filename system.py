@@ -1,14 +1,19 @@
-from typing import Tuple, List, Set, Dict, Optional
+import multiprocessing
+import resource
+from collections import OrderedDict
+from typing import Tuple, List, Set, FrozenSet, Dict, Iterator, Optional
 from fd.pddl import pddl_file
+from fd.pddl import tasks
 from fd.pddl.tasks import Task
 from fd.pddl.actions import Action
-from fd.pddl.conditions import Literal, Atom
-from fd.pddl.conditions import Conjunction
-from component import CompPrec, CompEffAdd, CompEffDel, Component
+from fd.pddl.conditions import Literal, Atom, NegatedAtom
+from component import CompPrec, CompEffAdd, CompEffDel, Component, ActionDelta
 from fd.pddl.pddl_types import TypedObject
-from utils import TypeDGraph, find_all_tuples
+from utils import TypeDGraph, AtomTable, LRUCache, find_all_tuples
 
 VarSubstitution =  List[Tuple[Action, Dict[str, TypedObject]]]
+# a state is a bitset over the ids of ground atoms in an AtomTable
+State = int
 
 class DiagnosisInfo:
     def __init__(self, result : bool, 
@@ -28,68 +33,530 @@ class DiagnosisInfo:
         self.atom = atom
         self.idx = idx
 
+class StepProgram:
+    def __init__(self, prec : List[Tuple[int, bool]], 
+                 add_effs : List[int], 
+                 del_effs : List[int]) -> None:
+        """A (possibly repaired) action in a plan step grounded to the ids
+        of atoms in an AtomTable
+
+        Args:
+            prec (List[Tuple[int, bool]]): The ids of the atoms in the precondition
+            paired with whether they are negated, in the order of the precondition
+            add_effs (List[int]): The ids of the atoms in the positive effects
+            del_effs (List[int]): The ids of the atoms in the negative effects
+        """
+        self.prec = prec
+        self.add_effs = add_effs
+        self.del_effs = del_effs
+        self.pos_mask, self.neg_mask = 0, 0
+        for idx, negated in prec:
+            if negated:
+                self.neg_mask |= 1 << idx
+            else:
+                self.pos_mask |= 1 << idx
+        self.add_mask, self.del_mask = 0, 0
+        for idx in add_effs:
+            self.add_mask |= 1 << idx
+        for idx in del_effs:
+            self.del_mask |= 1 << idx
+
+    def unsat(self, s : State) -> Optional[Tuple[int, bool]]:
+        """Finding the first atom in the precondition that is not satisfied in a state
+
+        Args:
+            s (State): A state
+
+        Returns:
+            Optional[Tuple[int, bool]]: The id of the unsatisfied atom and whether it
+            is negated if there exists any, None otherwise
+        """
+        if (s & self.pos_mask) == self.pos_mask and not (s & self.neg_mask):
+            return None
+        for idx, negated in self.prec:
+            if bool((s >> idx) & 1) == negated:
+                return idx, negated
+        return None
+
+    def unsat_all(self, s : State) -> List[int]:
+        """Finding all atoms in the precondition that are not satisfied in a state
+
+        Args:
+            s (State): A state
+
+        Returns:
+            List[int]: The positions of the unsatisfied atoms in the precondition
+        """
+        if (s & self.pos_mask) == self.pos_mask and not (s & self.neg_mask):
+            return []
+        return [pos for pos, (idx, negated) in enumerate(self.prec) 
+                if bool((s >> idx) & 1) == negated]
+
+    def apply(self, s : State) -> State:
+        return (s & ~self.del_mask) | self.add_mask
+
+class SimulationNode:
+    def __init__(self, parent : Optional["SimulationNode"], 
+                 key : Optional[FrozenSet[Component]], 
+                 start : int, 
+                 end : int) -> None:
+        """A node of a SimulationTrie, holding the states of a segment of a plan
+
+        Args:
+            parent (Optional[SimulationNode]): The parent node, None for the root
+            key (Optional[FrozenSet[Component]]): The components targeted at the 
+                action schema that first occurs at the step before the segment
+            start (int): The index of the first step whose state is in the segment
+            end (int): The index of the last step whose state is in the segment
+        """
+        self.parent = parent
+        self.key = key
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.start = start
+        self.end = end
+        # self.states[i] is the state before executing the (start + i)-th action
+        self.states = []
+        self.children = {}
+
+    def is_complete(self) -> bool:
+        return len(self.states) == self.end - self.start + 1
+
+class SimulationTrie:
+    def __init__(self, first_occurrences : List[Tuple[str, int]], 
+                 plan_length : int, 
+                 init : State, 
+                 max_states : int) -> None:
+        """The states reached by simulating a plan under several candidates. 
+        The state before a step only depends on the components targeted at 
+        the action schemas that occur before the step, so the plan is split 
+        into segments at the first occurrences of its action schemas, and the 
+        states of a segment are shared by the candidates that repair the action 
+        schemas occurring before it the same way. A node at depth k holds the 
+        states of the k-th segment and its children are keyed by the components 
+        targeted at the (k + 1)-th action schema. Only the states before the 
+        steps whose previous steps are all applicable are stored.
+
+        Args:
+            first_occurrences (List[Tuple[str, int]]): The action schemas in 
+                the plan paired with the indices of their first occurrences, 
+                in the order of the plan
+            plan_length (int): The number of steps of the plan
+            init (State): The initial state
+            max_states (int): The number of states (and nodes) kept after 
+                each eviction, the least recently used nodes are evicted with 
+                their descendants
+        """
+        self._names = [name for name, _ in first_occurrences]
+        # the last index of each segment, the last segment ends at the goals
+        self._ends = [idx for _, idx in first_occurrences] + [plan_length]
+        self._max_states = max_states
+        self.root = SimulationNode(None, None, 0, self._ends[0])
+        self.root.states.append(init)
+        # the nodes in the order of their uses
+        self._nodes = OrderedDict([(self.root, None)])
+        self._size = 2
+
+    def walk(self, repairs : Dict[str, FrozenSet[Component]]) -> List[SimulationNode]:
+        """Finding the nodes of the segments already simulated under a group 
+        of repairs
+
+        Args:
+            repairs (Dict[str, FrozenSet[Component]]): A group of repairs 
+                targeted at each action
+
+        Returns:
+            List[SimulationNode]: The nodes, from the root
+        """
+        path = [self.root]
+        while path[-1].is_complete() and path[-1].depth < len(self._names):
+            node = path[-1].children.get(
+                    repairs.get(self._names[path[-1].depth], frozenset()))
+            if node is None:
+                break
+            path.append(node)
+        # the ancestors are used after their descendants, so that 
+        # a node is only evicted after its descendants
+        for node in reversed(path):
+            self._nodes.move_to_end(node)
+        return path
+
+    def extend(self, node : SimulationNode, 
+               repairs : Dict[str, FrozenSet[Component]], 
+               idx : int, 
+               s : State) -> SimulationNode:
+        """Storing the state before a step, following the state before the 
+        previous step, in the node of the previous state if the step is in its 
+        segment, otherwise in a child of the node. The state is not stored again 
+        if another candidate with the same repairs already stored it.
+
+        Args:
+            node (SimulationNode): The node of the state before the previous step
+            repairs (Dict[str, FrozenSet[Component]]): A group of repairs 
+                targeted at each action
+            idx (int): The index of the step
+            s (State): The state
+
+        Returns:
+            SimulationNode: The node storing the state
+        """
+        if idx > node.end:
+            key = repairs.get(self._names[node.depth], frozenset())
+            child = node.children.get(key)
+            if child is None:
+                child = SimulationNode(node, key, node.end + 1, 
+                                       self._ends[node.depth + 1])
+                node.children[key] = child
+                self._nodes[child] = None
+                self._size += 1
+            node = child
+        if idx == node.start + len(node.states):
+            node.states.append(s)
+            self._size += 1
+        return node
+
+    def evict(self) -> None:
+        """Evicting the least recently used nodes, with their descendants, 
+        while the trie is too large. Nodes are only evicted between batches 
+        of simulations (see SystemSingle._simulate), since a node returned by 
+        walk or extend must stay in the trie while states are stored in it
+        """
+        while self._size > self._max_states and len(self._nodes) > 1:
+            node = next(iter(self._nodes))
+            if node is self.root:
+                self._nodes.move_to_end(node)
+                continue
+            del node.parent.children[node.key]
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                stack.extend(n.children.values())
+                if n in self._nodes:
+                    del self._nodes[n]
+                self._size -= len(n.states) + 1
+
 class Infos:
     def __init__(self, 
-                 infos : List[DiagnosisInfo]) -> None:
+                 infos : List[Optional[DiagnosisInfo]]) -> None:
+        # the information of a task is None if the task was not checked
         self.infos = infos
         self.result = True
         for info in self.infos:
-            if not info.result:
+            if info is not None and not info.result:
                 self.result = False
                 break
+class Domain:
+    def __init__(self, domain_file : str, 
+                 max_repaired_actions : int = 4096) -> None:
+        """Parsing a domain file once so that it can be shared by
+        all tasks
+
+        Args:
+            domain_file (str): Path to a domain file
+            max_repaired_actions (int): The number of repaired actions 
+                kept by repaired_action, the least recently used are evicted
+        """
+        domain_pddl = pddl_file.parse_pddl_file("domain", domain_file)
+        (self.name, self.requirements, self.types, self.constants, 
+                self.predicates, self.functions, self.actions, 
+                self.axioms) = tasks.parse_domain(domain_pddl)
+        # mapping action names to Action objects 
+        self.name_to_action = {a.name: a for a in self.actions}
+        # type graph for storing subtype relations
+        self.type_graph = TypeDGraph(self.types)
+        # repaired actions keyed by the names of their action schemas and 
+        # the sets of components composed onto them
+        self._repaired_actions = LRUCache(max_repaired_actions)
+
+    def repaired_action(self, action : Action, 
+                        comps : List[Component]) -> ActionDelta:
+        """Composing components onto an action schema. The repaired actions 
+        are cached, so the tasks, and the steps of their plans, that repair 
+        an action schema the same way share one repaired action
+
+        Args:
+            action (Action): An action schema of the domain
+            comps (List[Component]): Components targeted at the action schema
+
+        Returns:
+            ActionDelta: The repaired action
+        """
+        key = (action.name, frozenset(comps))
+        repaired = self._repaired_actions.get(key)
+        if repaired is not None:
+            return repaired
+        repaired = ActionDelta(action)
+        for comp in comps:
+            repaired = comp.compose(repaired)
+        self._repaired_actions.put(key, repaired)
+        return repaired
+
+    def open_task(self, task_file : str) -> Task:
+        """Parsing a task file against this domain, the resulting task
+        references the domain's types, predicates and action schemas
+        instead of copies of them
+
+        Args:
+            task_file (str): Path to a task file
+
+        Returns:
+            Task: The planning task
+        """
+        task_pddl = pddl_file.parse_pddl_file("task", task_file)
+        # the list of actions is copied since a task's actions may be replaced 
+        # by their repaired versions
+        domain = (self.name, self.requirements, self.types, self.constants, 
+                  self.predicates, self.functions, list(self.actions), self.axioms)
+        return Task.parse_with_domain(domain, task_pddl)
+
+def _serve(conn, domain_file : str, 
+           task_files : List[str], 
+           plan_files : List[str], 
+           max_failures : int, 
+           all_conflicts : bool, 
+           max_states : int, 
+           max_cached : int) -> None:
+    """Running a worker process which owns the systems of a shard of tasks
+    and answers the requests sent by System through a pipe
+
+    Args:
+        conn: The worker's end of the pipe
+        domain_file (str): Path to a domain file
+        task_files (List[str]): Paths to the task files of the shard
+        plan_files (List[str]): Paths to the respective plan files
+        max_failures (int): See System
+        all_conflicts (bool): See System
+        max_states (int): See System, the share of the tasks of the shard
+        max_cached (int): See System
+    """
+    systems = System(domain_file, task_files, plan_files, 
+                     max_failures=max_failures, all_conflicts=all_conflicts, 
+                     max_states=max_states, max_cached=max_cached)
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            result = getattr(systems, method)(*args)
+        except Exception as e:
+            result = e
+        # the peak memory of the worker is sent with every reply, 
+        # so that System.peak_memory does not need to ask for it
+        conn.send((result, systems.peak_memory()))
+    conn.close()
+
 class System:
     def __init__(self, domain_file : str, 
                  task_files : List[str], 
-                 plan_files : List[str]) -> None:
+                 plan_files : List[str], 
+                 num_workers : int = 1, 
+                 max_failures : int = 0, 
+                 all_conflicts : bool = False, 
+                 max_states : int = 1 << 19, 
+                 max_cached : int = 4096) -> None:
+        """Constructing the systems of all tasks
+
+        Args:
+            domain_file (str): Path to a domain file
+            task_files (List[str]): Paths to the task files
+            plan_files (List[str]): Paths to the respective plan files
+            num_workers (int): If greater than 1, the tasks are split into 
+                this many shards, each of which is owned by a worker process 
+                that checks its tasks in parallel with the other workers
+            max_failures (int): If greater than 0, checking a candidate stops 
+                once this many tasks (per worker) have failed. Tasks are checked 
+                in the order of their most recent failures
+            all_conflicts (bool): If True, find_conflict keeps simulating the plan 
+                of a failing task past its first unsatisfied atom and returns 
+                a conflict for every unsatisfied precondition and goal
+            max_states (int): The number of simulated states kept for all tasks 
+                (see SimulationTrie), shared evenly by the tasks
+            max_cached (int): The number of repaired actions kept by the domain 
+                (see Domain.repaired_action), and the numbers of matched add 
+                effects and of results and conflicts of candidates kept for each task
+        """
         self._systems = []
+        self._workers = []
+        self._task_files = task_files
+        self._max_failures = max_failures
+        self._all_conflicts = all_conflicts
+        self._max_states = max_states
+        self._max_cached = max_cached
+        self.domain = Domain(domain_file, max_cached)
+        num_workers = min(num_workers, len(task_files))
+        if num_workers > 1:
+            self._start_workers(domain_file, task_files, plan_files, num_workers)
+            return
         zipped_files = zip(task_files, plan_files)
         for task_file, plan_file in zipped_files:
             system_single = self.SystemSingle(
-                    domain_file, task_file, plan_file)
+                    self.domain, task_file, plan_file, 
+                    max(1, max_states // len(task_files)), max_cached=max_cached)
             self._systems.append(system_single)
+        # the order in which the tasks are checked
+        self._order = list(range(len(self._systems)))
+
+    def _start_workers(self, domain_file : str, 
+                       task_files : List[str], 
+                       plan_files : List[str], 
+                       num_workers : int) -> None:
+        # each worker owns a contiguous shard of tasks, so gathering the 
+        # results in the order of the workers preserves the order of tasks
+        bounds = [len(task_files) * i // num_workers for i in range(num_workers + 1)]
+        for lo, hi in zip(bounds, bounds[1:]):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                    target=_serve, 
+                    args=(worker_conn, domain_file, task_files[lo:hi], 
+                          plan_files[lo:hi], self._max_failures, 
+                          self._all_conflicts, 
+                          self._max_states * (hi - lo) // len(task_files), 
+                          self._max_cached),
+                    daemon=True)
+            process.start()
+            worker_conn.close()
+            self._workers.append((conn, process, hi - lo))
+        # the peak memory of each worker in MB, as of its last reply
+        self._worker_peaks = [0] * len(self._workers)
+
+    def _broadcast(self, method : str, args_per_worker : List[tuple]) -> list:
+        for (conn, _, _), args in zip(self._workers, args_per_worker):
+            conn.send((method, args))
+        results = []
+        for i, (conn, _, _) in enumerate(self._workers):
+            result, self._worker_peaks[i] = conn.recv()
+            if isinstance(result, Exception):
+                raise result
+            results.append(result)
+        return results
+
+    def peak_memory(self) -> float:
+        """Computing the peak resident memory of this process and of the worker 
+        processes if there are any, as the sum of their peaks (which overcounts 
+        the memory the workers share with this process). The peak of a worker 
+        is the one it sent with its last reply, so checking the memory does 
+        not wait for the workers
+
+        Returns:
+            float: The peak memory in MB
+        """
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if self._workers:
+            peak += sum(self._worker_peaks)
+        return peak
+
+    def close(self) -> None:
+        """Stopping the worker processes if there are any
+        """
+        for conn, process, _ in self._workers:
+            conn.send(None)
+            process.join()
+            conn.close()
+        self._workers = []
     
     def is_diagnosis(self, 
                      candidate : Set[Component]) -> Infos:
-        infos = []
-        for syt in self._systems:
-            info = syt.is_diagnosis(candidate)
-            infos.append(info)
-        return Infos(infos)
+        return self.is_diagnosis_batch([candidate])[0]
+
+    def is_diagnosis_batch(self, 
+                           candidates : List[Set[Component]]) -> List[Infos]:
+        """Deciding whether each of several candidate sets of components is 
+        a diagnosis. The plan of each task is simulated under all candidates 
+        in lockstep (see SystemSingle.is_diagnosis_batch)
+
+        Args:
+            candidates (List[Set[Component]]): Candidate sets of components
+
+        Returns:
+            List[Infos]: Information about the test of each candidate
+        """
+        if self._workers:
+            infos = [[] for _ in candidates]
+            results = self._broadcast(
+                    "is_diagnosis_batch", [(candidates,)] * len(self._workers))
+            for result in results:
+                for j, worker_infos in enumerate(result):
+                    infos[j].extend(worker_infos.infos)
+            return [Infos(task_infos) for task_infos in infos]
+        infos = [[None] * len(self._systems) for _ in candidates]
+        num_failures = [0] * len(candidates)
+        failures = []
+        for idx in self._order:
+            # the candidates that have not failed max_failures tasks
+            active = [j for j in range(len(candidates)) 
+                      if num_failures[j] != self._max_failures or self._max_failures == 0]
+            if not active:
+                break
+            results = self._systems[idx].is_diagnosis_batch(
+                    [candidates[j] for j in active])
+            for j, info in zip(active, results):
+                infos[j][idx] = info
+                if not info.result:
+                    num_failures[j] += 1
+                    if not failures or failures[-1] != idx:
+                        failures.append(idx)
+        if failures:
+            # moving the tasks that failed to the front
+            failed = set(failures)
+            self._order = failures + [idx for idx in self._order if idx not in failed]
+        return [Infos(task_infos) for task_infos in infos]
     
     def find_conflict(self, 
                       candidate : Set[Component], 
                       infos : Infos) -> List[Set[Component]]:
         conflicts = []
+        if self._workers:
+            args_per_worker, lo = [], 0
+            for _, _, size in self._workers:
+                args_per_worker.append((candidate, Infos(infos.infos[lo:lo + size])))
+                lo += size
+            for result in self._broadcast("find_conflict", args_per_worker):
+                conflicts.extend(result)
+            return conflicts
         for syt, info in zip(self._systems, infos.infos):
-            if info.result:
+            if info is None or info.result:
                 continue
-            conflicts.append(syt.find_conflict(candidate, info))
+            conflicts.extend(syt.find_conflicts(candidate, info, self._all_conflicts))
         return conflicts
     
     def get_task(self) -> Task:
+        if not self._systems:
+            return self.domain.open_task(self._task_files[0])
         return self._systems[0].task
 
     class SystemSingle:
-        def __init__(self, domain_file : str, 
+        def __init__(self, domain : Domain, 
                      task_file : str, 
-                     plan_file : str):
+                     plan_file : str, 
+                     max_states : int = 1 << 16, 
+                     programs_per_step : int = 4, 
+                     max_cached : int = 4096):
             """Constructing a system object
 
             Args:
-                domain_file (str): Path to a domain file
+                domain (Domain): A parsed domain
                 task_file (str): Path to a task file
                 plan_file (str): Path to a plan file
+                max_states (int): The number of simulated states kept for the task
+                programs_per_step (int): The number of compiled actions kept 
+                    per step of the plan, so that the compiled actions of 
+                    the whole plan are kept under a few groups of repairs
+                max_cached (int): The numbers of matched add effects and of 
+                    results and conflicts of candidates kept
             """
-            self.task = pddl_file.open(task_file, domain_file)
+            self.domain = domain
+            self.task = domain.open_task(task_file)
             self.constants = list(self.task.constants) # constants in the planning problem
             # mapping action names to Action objects 
-            self.name_to_action = {a.name: a for a in self.task.actions}
+            self.name_to_action = domain.name_to_action
             # mapping object names to TypedObject objects
             self.name_to_object = {o.name: o for o in self.task.objects}
             # mapping object names to the respective types
             self.object_to_type = {o.name: o.type for o in self.task.objects}
             # type graph for storing subtype relations
-            self.type_graph = TypeDGraph(self.task.types)
+            self.type_graph = domain.type_graph
+            # mapping ground atoms to the bits representing them in states
+            self.atom_table = AtomTable()
             try:
                 with open(plan_file, "r") as pf:
                     lines = pf.readlines()
@@ -100,33 +567,35 @@ class System:
                 self.plan.pop(-1)
             # computing variable substitution functions for each action in the plan
             self._get_substitutions()
-
-        def _is_prec_sat(self, action : Action, 
-                         substitution : VarSubstitution, 
-                         s : Set[Literal]) -> Optional[Literal]:
-            """Deciding whether an action's precondition is satisfied in a state, provided 
-            the respective variable substitution function
-
-            Args:
-                action (Action): An action
-                substitution (VarSubstitution): A variable substitution function
-                s (Set[Literal]): A state
-
-            Returns:
-                Optional[Literal]: An unsatisfied atom if there exists any, None
-                otherwise
-            """
-            literals = (action.precondition,)
-            if isinstance(action.precondition, Conjunction):
-                literals = action.precondition.parts
-            for literal in literals:
-                grounded_paras = tuple(substitution[para].name for para in literal.args)
-                atom = Atom(literal.predicate, grounded_paras)
-                if (not literal.negated) and (atom not in s):
-                    return atom
-                if (literal.negated) and (atom in s):
-                    return atom.negate() # return a negated atom to indicate that it shall be deleted
-            return None
+            # the first index in the plan at which each action schema occurs
+            self._first_occurrence = {}
+            for idx, (action, _) in enumerate(self.substitutions):
+                self._first_occurrence.setdefault(action.name, idx)
+            # mapping object names to the bitsets of the plan steps whose 
+            # substitutions ground some variable or constant to them
+            self._steps_of_object = {}
+            for idx, (_, substitution) in enumerate(self.substitutions):
+                for o in substitution.values():
+                    self._steps_of_object[o.name] = \
+                            self._steps_of_object.get(o.name, 0) | (1 << idx)
+            # parameters of each action schema whose types are compatible with 
+            # each object, keyed by the name of the action schema and the object
+            self._compatible_paras = {}
+            # lifted atoms that can be added to the effects of a plan step,
+            # keyed by the index of the step and a ground atom
+            self._add_effs = LRUCache(max_cached)
+            # results and conflicts of the checked candidates, keyed by their 
+            # projections onto the action schemas in the plan (see _project)
+            self._results = LRUCache(max_cached)
+            self._conflicts = LRUCache(max_cached)
+            # states reached by the simulations of the plan under the checked candidates
+            init = [a for a in self.task.init if isinstance(a, Atom)]
+            self._trie = SimulationTrie(
+                    sorted(self._first_occurrence.items(), key=lambda item: item[1]), 
+                    len(self.substitutions), self.atom_table.state(init), max_states)
+            # compiled actions of plan steps, keyed by the index of the step and 
+            # the set of components targeted at the step's action schema
+            self._programs = LRUCache(programs_per_step * len(self.substitutions))
 
         def _group_comps(self, candidate : Set[Component]) -> Dict[str, List[Component]]:
             """Grouping a candidate set of components by their target action schemas' names
@@ -145,30 +614,58 @@ class System:
                     group_by_action[comp.action_name] = [comp]
             return group_by_action
 
-        def _next_state(self, action : Action, substitution :  VarSubstitution, state : Set[Literal]) -> None:
-            """Computing the next state after applying an action in a state.
+        def _compile_step(self, action : ActionDelta, substitution : VarSubstitution) -> StepProgram:
+            """Grounding an action's precondition and effects to the ids of atoms, provided
+            the respective variable substitution function
 
             Args:
-                action (Action): An action
+                action (ActionDelta): A (possibly repaired) action
                 substitution (VarSubstitution): A variable substitution function
-                state (Set[Literal]): A state
+
+            Returns:
+                StepProgram: The compiled action
             """
-            add_effs, del_effs = set(), set()
-            for eff in action.effects:
-                assert(len(eff.parameters) == 0)
-                literal = eff.literal
+            prec = []
+            for literal in action.prec_literals():
                 grounded_paras = tuple(substitution[para].name for para in literal.args)
-                atom = Atom(literal.predicate, grounded_paras)
+                prec.append((self.atom_table.id(literal.predicate, grounded_paras), literal.negated))
+            add_effs, del_effs = [], []
+            for literal in action.eff_literals():
+                grounded_paras = tuple(substitution[para].name for para in literal.args)
+                idx = self.atom_table.id(literal.predicate, grounded_paras)
                 if literal.negated:
-                    del_effs.add(atom)
+                    del_effs.append(idx)
                 else:
-                    add_effs.add(atom)
-            for eff in del_effs:
-                if eff in state:
-                    state.remove(eff)
-            for eff in add_effs:
-                state.add(eff)  
-            
+                    add_effs.append(idx)
+            return StepProgram(prec, add_effs, del_effs)
+
+        def _get_program(self, idx : int, 
+                         repairs : Dict[str, FrozenSet[Component]], 
+                         repairs_to_actions : Dict[str, List[Component]]) -> StepProgram:
+            """Getting the compiled action of a plan step under a group of repairs.
+            Compiled actions are cached by the step and the repairs targeted at the
+            step's action schema, so a step is only compiled again when its action
+            schema is repaired differently, or when its compiled action was evicted.
+
+            Args:
+                idx (int): The index of the step in the plan
+                repairs (Dict[str, FrozenSet[Component]]): A group of repairs targeted
+                    at each action
+                repairs_to_actions (Dict[str, List[Component]]): The same group of
+                    repairs in the order in which they are applied
+
+            Returns:
+                StepProgram: The compiled action
+            """
+            action, substitution = self.substitutions[idx]
+            key = (idx, repairs.get(action.name, frozenset()))
+            program = self._programs.get(key)
+            if program is None:
+                action = self._get_repaired_action(action, repairs_to_actions)
+                program = self._compile_step(action, substitution)
+                self._programs.put(key, program)
+            return program
+
         def _get_substitutions(self) -> None:
             """Computing the variable substitution functions for each action in the plan.
             
@@ -186,22 +683,19 @@ class System:
                 var_map.update([(c.name, c) for c in self.constants])
                 self.substitutions.append((action, var_map))
 
-        def _is_existing_eff(self, action : Action, atom : Atom) -> bool:
+        def _is_existing_eff(self, action : ActionDelta, atom : Atom) -> bool:
             """Checking whether an atom is already in an action's
             (positive or negative) effects           
 
             Args:
-                action (Action): an action
+                action (ActionDelta): an action
                 atom (Atom): an atom to be checked
 
             Returns:
                 bool: True if the atom is in the action's effects,
                 False otherwise
             """
-            for eff in action.effects:
-                if eff.literal == atom:
-                    return True
-            return False
+            return atom in action.eff_literals()
 
         def _matching(self, parts : List[Literal], substitution : VarSubstitution, atom : Literal) -> Set[Literal]:
             """Computing all atoms in some action schema which can be grounded to a
@@ -226,7 +720,7 @@ class System:
             return atoms
 
         def _matching_prec(self, 
-                        action : Action, 
+                        action : ActionDelta, 
                         substitution: VarSubstitution, 
                         atom : Literal) -> Set[Literal]:
             """Computing a set of atoms that can be removed from the action schema's
@@ -234,20 +728,17 @@ class System:
             in some action's precondition that is not satisfied.
 
             Args:
-                action (Action): an action schema
+                action (ActionDelta): a (possibly repaired) action schema
                 substitution (VarSubstitution): a variable substitution function
                 atom (Literal): A grounded atom
 
             Returns:
                 Set[Literal]: A set of atoms
             """
-            literals = (action.precondition, )
-            if isinstance(action.precondition, Conjunction):
-                literals = action.precondition.parts
-            return self._matching(literals, substitution, atom)
+            return self._matching(action.prec_literals(), substitution, atom)
 
         def _matching_neg_effs(self, 
-                            action: Action, 
+                            action: ActionDelta, 
                             substitution: VarSubstitution, 
                             atom : Literal) -> Set[Literal]:
             """Computing a set of atoms that can be deleted from the action schema's
@@ -255,18 +746,18 @@ class System:
             in some action's precondition that is not satisfied.
 
             Args:
-                action (Action): an action schema
+                action (ActionDelta): a (possibly repaired) action schema
                 substitution (VarSubstitution): a variable substitution function
                 atom (Literal): A grounded atom
 
             Returns:
                 Set[Literal]: A set of atoms
             """
-            del_effs = [eff.literal.negate() for eff in action.effects if eff.literal.negated]
+            del_effs = [l.negate() for l in action.eff_literals() if l.negated]
             return self._matching(del_effs, substitution, atom)
         
         def _matching_pos_effs(self, 
-                            action: Action, 
+                            action: ActionDelta, 
                             substitution: VarSubstitution, 
                             atom : Literal) -> Set[Literal]:
             """Computing a set of atoms that can be deleted from the action schema's
@@ -274,18 +765,18 @@ class System:
             in some action's precondition that is not satisfied.
 
             Args:
-                action (Action): an action schema
+                action (ActionDelta): a (possibly repaired) action schema
                 substitution (VarSubstitution): a variable substitution function
                 atom (Literal): A grounded atom
 
             Returns:
                 Set[Literal]: A set of atoms
             """
-            pos_effs = [eff.literal for eff in action.effects if not eff.literal.negated]
+            pos_effs = [l for l in action.eff_literals() if not l.negated]
             return self._matching(pos_effs, substitution, atom)
 
         def _matching_add_effs(self, 
-                            action: Action, 
+                            action: ActionDelta, 
                             substitution: VarSubstitution, 
                             atom : Literal) -> Set[Literal]:
             """Finding a set of atoms (either positive or negative) that can be
@@ -295,36 +786,70 @@ class System:
             satisfied.
 
             Args:
-                action (Action): an action schema
+                action (ActionDelta): a (possibly repaired) action schema
                 substitution (VarSubstitution): a variable substitution function
                 atom (Literal): Grounded atom
 
             Returns:
                 Set[Literal]: A set of (lifted) atoms
             """
-            # can be further optimized
+            # for each argument, only the type-compatible parameters grounded to it
+            # (and the argument itself if it is a constant) are matched, so every
+            # tuple of matched parameters grounds to the atom
             matched_paras = []
             for o in atom.args:
-                paras = []
-                for para in action.parameters:
-                    if self.type_graph.subtype(self.object_to_type[o], para.type):
-                        paras.append(para.name)
-                if o in substitution:
+                paras = [para for para in self._get_compatible_paras(action, o)
+                         if substitution[para].name == o]
+                if o in substitution and substitution[o].name == o:
                     paras.append(o)
                 if len(paras) == 0:
                     return set()
                 matched_paras.append(paras)
-            all_tuples = find_all_tuples(matched_paras)
-            re = set()
-            for t in all_tuples:
-                grounded_paras = tuple(substitution[v].name for v in t)
-                if grounded_paras == atom.args:
-                    re.add(Atom(atom.predicate, t))
-            return re
+            return {Atom(atom.predicate, t) for t in find_all_tuples(matched_paras)}
+
+        def _get_compatible_paras(self, action : ActionDelta, o : str) -> List[str]:
+            """Getting the parameters of an action schema whose types are 
+            compatible with an object
+
+            Args:
+                action (ActionDelta): A (possibly repaired) action schema
+                o (str): The name of an object
+
+            Returns:
+                List[str]: The names of the parameters
+            """
+            key = (action.name, o)
+            paras = self._compatible_paras.get(key)
+            if paras is None:
+                paras = [para.name for para in action.parameters 
+                         if self.type_graph.subtype(self.object_to_type[o], para.type)]
+                self._compatible_paras[key] = paras
+            return paras
+
+        def _steps_touching(self, atom : Atom, idx : int) -> Iterator[int]:
+            """Iterating backwards over the plan steps before an index whose 
+            substitutions ground some variable or constant to each argument 
+            of an atom. The effects of the other steps, repaired or not, 
+            cannot be grounded to the atom.
+
+            Args:
+                atom (Atom): A grounded atom
+                idx (int): An index in the plan
+
+            Yields:
+                Iterator[int]: The indices of the steps, in decreasing order
+            """
+            steps = (1 << idx) - 1
+            for o in atom.args:
+                steps &= self._steps_of_object.get(o, 0)
+            while steps:
+                i = steps.bit_length() - 1
+                yield i
+                steps ^= 1 << i
 
         def _get_repaired_action(
                 self, action : Action, 
-                repairs_to_actions : Dict[str, List[Component]]) -> Action:
+                repairs_to_actions : Dict[str, List[Component]]) -> ActionDelta:
             """Apply repairs to an action
 
             Args:
@@ -333,15 +858,29 @@ class System:
                     targeted at the action
 
             Returns:
-                Action: _description_
+                ActionDelta: The repaired action
             """
-            if action.name in repairs_to_actions:
-                for comp in repairs_to_actions[action.name]:
-                    action = comp.apply(action)
-            return action
+            return self.domain.repaired_action(
+                    action, repairs_to_actions.get(action.name, []))
+
+        def _project(self, candidate : Set[Component]) -> FrozenSet[Component]:
+            """Projecting a candidate onto the action schemas in the plan. The 
+            components targeted at other action schemas change no step of the plan, 
+            so the candidates with the same projection have the same results.
+
+            Args:
+                candidate (Set[Component]): A set of candidate components
+
+            Returns:
+                FrozenSet[Component]: The components targeted at the action 
+                schemas in the plan
+            """
+            return frozenset(c for c in candidate 
+                             if c.action_name in self._first_occurrence)
 
         def is_diagnosis(self, candidate : Set[Component]) -> DiagnosisInfo:
             """Deciding whether a candidate set of components is a diagnosis.
+            The results are cached by the projections of the candidates.
 
             Args:
                 candidate (Set[Component]): A set of candidate components
@@ -349,24 +888,186 @@ class System:
             Returns:
                 DiagnosisInfo: Information about the test
             """
-            self.cache = []
+            return self.is_diagnosis_batch([candidate])[0]
+
+        def is_diagnosis_batch(self, candidates : List[Set[Component]]) -> List[DiagnosisInfo]:
+            """Deciding whether each of several candidate sets of components is 
+            a diagnosis. The results are cached by the projections of the candidates, 
+            and the candidates whose projections were not checked yet are simulated 
+            together.
+
+            Args:
+                candidates (List[Set[Component]]): Candidate sets of components
+
+            Returns:
+                List[DiagnosisInfo]: Information about the test of each candidate
+            """
+            projections = [self._project(candidate) for candidate in candidates]
+            results, unchecked = {}, {}
+            for projection, candidate in zip(projections, candidates):
+                info = self._results.get(projection)
+                if info is not None:
+                    results[projection] = info
+                else:
+                    unchecked.setdefault(projection, candidate)
+            if unchecked:
+                infos = self._simulate(list(unchecked.values()))
+                for projection, info in zip(unchecked, infos):
+                    results[projection] = info
+                    self._results.put(projection, info)
+            return [results[projection] for projection in projections]
+
+        def _simulate(self, candidates : List[Set[Component]]) -> List[DiagnosisInfo]:
+            """Simulating the plan under several candidate sets of components in 
+            lockstep: each step is executed under all candidates still applicable 
+            before the next step, and the candidates with the same repairs of the 
+            step's action schema share its compiled action.
+
+            Args:
+                candidates (List[Set[Component]]): Candidate sets of components
+
+            Returns:
+                List[DiagnosisInfo]: Information about the test of each candidate
+            """
+            infos = [None] * len(candidates)
+            # for each candidate, its repairs grouped by action names and 
+            # the node and the state of the last simulated step
+            runs = []
+            # the candidates by the indices of the steps at which they are resumed
+            resumed = {}
+            for j, candidate in enumerate(candidates):
+                repairs_to_actions = self._group_comps(candidate)
+                repairs = {name: frozenset(comps) for name, comps in repairs_to_actions.items()}
+                # replaying the plan from the last state simulated under the same 
+                # repairs of the action schemas occurring before it
+                node = self._trie.walk(repairs)[-1]
+                runs.append([repairs, repairs_to_actions, node, node.states[-1]])
+                resumed.setdefault(node.start + len(node.states) - 1, []).append(j)
+            active = []
+            idx = min(resumed)
+            while idx < len(self.substitutions):
+                active.extend(resumed.pop(idx, ()))
+                if not active:
+                    if not resumed:
+                        # every candidate failed
+                        break
+                    # jumping to the step at which the next candidates are resumed
+                    idx = min(resumed)
+                    continue
+                name = self.substitutions[idx][0].name
+                programs = {}
+                applicable = []
+                for j in active:
+                    repairs, repairs_to_actions, node, s = runs[j]
+                    key = repairs.get(name, frozenset())
+                    program = programs.get(key)
+                    if program is None:
+                        program = self._get_program(idx, repairs, repairs_to_actions)
+                        programs[key] = program
+                    # decide whether the action's precondition is satisfied
+                    unsat = program.unsat(s)
+                    if unsat is not None:
+                        atom_idx, negated = unsat
+                        # a negated atom indicates that it shall be deleted
+                        atom_class = NegatedAtom if negated else Atom
+                        infos[j] = DiagnosisInfo(False, atom_class(*self.atom_table.key(atom_idx)), idx)
+                        continue
+                    s = program.apply(s)
+                    runs[j][2] = self._trie.extend(node, repairs, idx + 1, s)
+                    runs[j][3] = s
+                    applicable.append(j)
+                active = applicable
+                idx += 1
+            active.extend(resumed.pop(len(self.substitutions), ()))
+            for j in active:
+                s = runs[j][3]
+                infos[j] = DiagnosisInfo(True, None, None)
+                # is goal satisfied
+                for atom in self.task.goal.parts:
+                    is_true = s & self.atom_table.mask(atom.predicate, atom.args)
+                    if bool(is_true) == atom.negated:
+                        infos[j] = DiagnosisInfo(False, atom, len(self.substitutions))
+                        break
+            self._trie.evict()
+            return infos
+
+        def failures(self, candidate : Set[Component], 
+                     info : DiagnosisInfo) -> List[DiagnosisInfo]:
+            """Finding all unsatisfied preconditions and goals of the plan under 
+            a candidate, by simulating the plan past the first failure. Since 
+            a failing precondition does not change the effects of its step, 
+            the conflict of each failure holds for every diagnosis.
+            A failure is only reported for the first step at which each 
+            precondition of an action schema fails, and for the first goal of 
+            each predicate, since the later ones mostly lead to the same conflicts.
+
+            Args:
+                candidate (Set[Component]): The candidate of the last check
+                info (DiagnosisInfo): Information from the last check, which failed
+
+            Returns:
+                List[DiagnosisInfo]: Information about each failure, in the order 
+                of the plan
+            """
             repairs_to_actions = self._group_comps(candidate)
-            s = set(self.task.init.copy())
-            for idx, (action, substitution) in enumerate(self.substitutions):
-                action = self._get_repaired_action(action, repairs_to_actions)
-                # self.cache.append(action)
-                # decide whether the action's precondition is satisfied
-                unsat_atom = self._is_prec_sat(action, substitution, s)
-                if unsat_atom is not None:
-                    return DiagnosisInfo(False, unsat_atom, idx)
-                self._next_state(action, substitution, s)
-            # is goal satisfied
+            repairs = {name: frozenset(comps) for name, comps in repairs_to_actions.items()}
+            node = self._trie.walk(repairs)[-1]
+            start = node.start + len(node.states) - 1
+            assert(start <= info.idx)
+            s = node.states[-1]
+            # replaying the steps before the failure whose states were evicted
+            for idx in range(start, info.idx):
+                s = self._get_program(idx, repairs, repairs_to_actions).apply(s)
+            # the preconditions and the goal predicates already reported
+            failures, reported_precs, reported_goals = [], set(), set()
+            for idx in range(info.idx, len(self.substitutions)):
+                program = self._get_program(idx, repairs, repairs_to_actions)
+                name = self.substitutions[idx][0].name
+                for pos in program.unsat_all(s):
+                    if (name, pos) in reported_precs:
+                        continue
+                    reported_precs.add((name, pos))
+                    atom_idx, negated = program.prec[pos]
+                    atom_class = NegatedAtom if negated else Atom
+                    failures.append(DiagnosisInfo(
+                            False, atom_class(*self.atom_table.key(atom_idx)), idx))
+                # the states past the failure are not stored in the trie,
+                # since the next check must not skip the failing step
+                s = program.apply(s)
             for atom in self.task.goal.parts:
-                if (not atom.negated) and (atom not in s):
-                    return DiagnosisInfo(False, atom, len(self.substitutions))
-                if (atom.negated) and (atom in s):
-                    return DiagnosisInfo(False, atom, len(self.substitutions))
-            return DiagnosisInfo(True, None, None)
+                is_true = s & self.atom_table.mask(atom.predicate, atom.args)
+                if bool(is_true) == atom.negated and (
+                        (atom.predicate, atom.negated) not in reported_goals):
+                    reported_goals.add((atom.predicate, atom.negated))
+                    failures.append(DiagnosisInfo(False, atom, len(self.substitutions)))
+            return failures
+
+        def find_conflicts(self, candidate : Set[Component], 
+                           info : DiagnosisInfo, 
+                           all_conflicts : bool) -> List[Set[Component]]:
+            """Computing the conflicts of a candidate set of components provided 
+            the information from its check. The conflicts are cached by the 
+            projections of the candidates.
+
+            Args:
+                candidate (Set[Component]): A set of candidate components
+                info (DiagnosisInfo): Information from the check of the candidate
+                all_conflicts (bool): Whether a conflict is computed for every 
+                    failure of the plan (see failures) or only for the first one
+
+            Returns:
+                List[Set[Component]]: The conflicts
+            """
+            projection = self._project(candidate)
+            conflicts = self._conflicts.get(projection)
+            if conflicts is None:
+                failures = [info]
+                if all_conflicts:
+                    failures = self.failures(candidate, info)
+                conflicts = [self.find_conflict(candidate, failure) 
+                             for failure in failures]
+                self._conflicts.put(projection, conflicts)
+            return conflicts
 
         def find_conflict(self, candidate : Set[Component], info : DiagnosisInfo) -> Set[Component]:
             """Computing a conflict provided a candidate set of components and 
@@ -389,12 +1090,17 @@ class System:
                 atoms = self._matching_prec(action, substitution, atom)
                 for a in atoms:
                     conflict.add(CompPrec(action.name, a))
-            for i in range(idx - 1, -1, -1):
+            t = atom.negate() if atom.negated else atom
+            for i in self._steps_touching(t, idx):
                 action, substitution = self.substitutions[i]
                 action = self._get_repaired_action(action, repairs_to_action)
                 conf_add_atoms = []
-                t = atom.negate() if atom.negated else atom
-                for a in self._matching_add_effs(action, substitution, t):
+                key = (i, t)
+                add_effs = self._add_effs.get(key)
+                if add_effs is None:
+                    add_effs = self._matching_add_effs(action, substitution, t)
+                    self._add_effs.put(key, add_effs)
+                for a in add_effs:
                     a = a.negate() if atom.negated else a
                     if not self._is_existing_eff(action, a):
                         conf_add_atoms.append(a)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the modules of the diagnoser are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# options parses the command line when it is imported (by the diagnoser),
+# which would be the one of pytest
+sys.argv = sys.argv[:1]
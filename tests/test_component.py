@@ -0,0 +1,71 @@
+import itertools
+import os
+
+import pytest
+
+from component import ActionDelta, CompEffAdd, CompEffDel, CompPrec
+from fd.pddl.conditions import Atom, NegatedAtom
+from system import Domain
+
+DOMAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "domain.pddl")
+
+
+@pytest.fixture(scope="module")
+def domain():
+    return Domain(DOMAIN)
+
+
+def precs(action):
+    return set(action.precondition.parts)
+
+
+def effs(action):
+    return {eff.literal for eff in action.effects}
+
+
+# components of load, none of which undoes another
+LOAD_COMPS = [
+    CompPrec("load", Atom("empty", ("?t",))),
+    CompPrec("load", Atom("at", ("?p", "?l"))),
+    CompEffAdd("load", Atom("at", ("?t", "?l"))),
+    CompEffAdd("load", NegatedAtom("empty", ("?t",))),
+    CompEffDel("load", NegatedAtom("at", ("?p", "?l"))),
+]
+
+
+@pytest.mark.parametrize("size", range(len(LOAD_COMPS) + 1))
+def test_compose_matches_apply(domain, size):
+    action = domain.name_to_action["load"]
+    for comps in itertools.permutations(LOAD_COMPS, size):
+        applied, delta = action, ActionDelta(action)
+        for comp in comps:
+            applied = comp.apply(applied)
+            delta = comp.compose(delta)
+        repaired = delta.to_action()
+        assert precs(repaired) == precs(applied) == set(delta.prec_literals())
+        assert effs(repaired) == effs(applied) == set(delta.eff_literals())
+
+
+def test_to_action_without_repairs(domain):
+    action = domain.name_to_action["drive"]
+    assert ActionDelta(action).to_action() is action
+
+
+def test_removed_effects_are_removed_from_the_added_ones(domain):
+    action = domain.name_to_action["drive"]
+    at_to = Atom("at", ("?t", "?to"))
+    delta = CompEffAdd("drive", at_to).compose(ActionDelta(action))
+    assert at_to in delta.eff_literals()
+    delta = CompEffDel("drive", at_to).compose(delta)
+    assert at_to not in delta.eff_literals()
+    assert at_to not in effs(delta.to_action())
+    assert effs(delta.to_action()) == {NegatedAtom("at", ("?t", "?from"))}
+
+
+def test_repaired_actions_are_shared(domain):
+    action = domain.name_to_action["drive"]
+    comps = [CompEffAdd("drive", Atom("at", ("?t", "?to"))),
+             CompPrec("drive", Atom("road", ("?from", "?to")))]
+    repaired = domain.repaired_action(action, comps)
+    assert domain.repaired_action(action, comps[::-1]) is repaired
+    assert precs(repaired.to_action()) == {Atom("at", ("?t", "?from"))}
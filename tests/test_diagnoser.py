@@ -0,0 +1,146 @@
+import os
+
+import pytest
+
+import options
+from component import CompEffAdd, CompEffDel, CompPrec, CostModel
+from diagnoser import HITTERS, Diagnoser
+from fd.pddl.conditions import Atom
+from system import DiagnosisInfo, Infos, System
+
+PREC_A = CompPrec("a", Atom("p", ("?x",)))
+PREC_B = CompPrec("b", Atom("p", ("?x",)))
+ADD_C = CompEffAdd("c", Atom("q", ("?x",)))
+DEL_D = CompEffDel("d", Atom("q", ("?x",)))
+ADD_E = CompEffAdd("e", Atom("r", ("?x",)))
+
+
+class StubSystem:
+    '''
+      A system with a single task whose diagnoses are the supersets of the
+      given minimal diagnoses. The conflict of a candidate is made of the
+      components of the minimal diagnoses that it misses, which every
+      diagnosis hits. peak_memory grows by memory_per_check MB with each
+      checked candidate.
+    '''
+    def __init__(self, minimal, memory_per_check=0):
+        self.minimal = [set(d) for d in minimal]
+        self.memory_per_check = memory_per_check
+        self.checked = []
+
+    def is_diagnosis_batch(self, candidates):
+        self.checked.extend(candidates)
+        return [Infos([DiagnosisInfo(any(d <= c for d in self.minimal), None, None)])
+                for c in candidates]
+
+    def find_conflict(self, candidate, infos):
+        return [set().union(*(d - candidate for d in self.minimal))]
+
+    def peak_memory(self):
+        return self.memory_per_check * len(self.checked)
+
+
+# of weights 0.5, 2 and 3 with the cost model below,
+# under which PREC_A is the cheapest component
+MINIMAL = [{PREC_A}, {PREC_B, ADD_C}, {DEL_D, ADD_E}]
+COST_MODEL = CostModel(action_costs={"a": 0.5, "e": 2})
+
+
+@pytest.fixture(params=sorted(HITTERS))
+def hitter(request):
+    return request.param
+
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_k_best_diagnoses(hitter, batch_size):
+    diagnoser = Diagnoser(StubSystem(MINIMAL), cost_model=COST_MODEL,
+                          hitter=hitter, batch_size=batch_size)
+    result = diagnoser.search(5)
+    # every other diagnosis is a superset of one found,
+    # which the blocking conflicts forbid
+    assert result.diagnoses == MINIMAL
+    assert result.complete
+    assert diagnoser.diagnoses(2) == MINIMAL[:2]
+    assert diagnoser.diagnosis() == MINIMAL[0]
+
+
+def test_no_diagnosis(hitter):
+    diagnoser = Diagnoser(StubSystem([]), hitter=hitter)
+    assert diagnoser.diagnosis() is None
+    result = diagnoser.search(3)
+    assert result.diagnoses == []
+    assert result.complete
+
+
+def test_time_budget(hitter):
+    system = StubSystem(MINIMAL)
+    result = Diagnoser(system, time_budget=0, hitter=hitter).search(1)
+    assert not result.complete
+    assert result.diagnoses == [] and result.best is None
+    assert system.checked == []
+
+
+def test_memory_budget(hitter):
+    # the budget is exhausted after the second candidate is checked:
+    # the empty set, then the first diagnosis
+    system = StubSystem(MINIMAL, memory_per_check=10)
+    diagnoser = Diagnoser(system, memory_budget=15, cost_model=COST_MODEL,
+                          hitter=hitter)
+    result = diagnoser.search(3)
+    assert not result.complete
+    assert system.checked == [set(), MINIMAL[0]]
+    assert result.diagnoses == MINIMAL[:1]
+    assert result.best == set()
+    assert result.lower_bound <= 2
+    # and never with a larger budget
+    system = StubSystem(MINIMAL, memory_per_check=10)
+    diagnoser = Diagnoser(system, memory_budget=1000, cost_model=COST_MODEL,
+                          hitter=hitter)
+    assert diagnoser.search(3).complete
+
+
+@pytest.mark.parametrize("cost_model, expected", [
+    (CostModel(prec_cost=5), {DEL_D, ADD_E}),
+    (CostModel(predicate_costs={"p": 3}), {DEL_D, ADD_E}),
+    (CostModel(prec_cost=2, add_eff_cost=0.5), {DEL_D, ADD_E}),
+    (CostModel(action_costs={"a": 4, "b": 0.1}), {PREC_B, ADD_C}),
+])
+def test_cost_model(hitter, cost_model, expected):
+    diagnoser = Diagnoser(StubSystem(MINIMAL), cost_model=cost_model, hitter=hitter)
+    assert diagnoser.diagnosis() == expected
+
+
+def test_cost():
+    cost_model = CostModel(prec_cost=2, add_eff_cost=3, del_eff_cost=5,
+                           action_costs={"a": 7}, predicate_costs={"p": 11, "q": 13})
+    assert cost_model.cost(PREC_A) == 2 * 7 * 11
+    assert cost_model.cost(PREC_B) == 2 * 11
+    assert cost_model.cost(ADD_C) == 3 * 13
+    assert cost_model.cost(DEL_D) == 5 * 13
+    assert cost_model.cost(ADD_E) == 3
+
+
+def test_parse_costs(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["diagnoser.py", "--prec_cost", "2",
+                                     "--action_costs", "drive=3", "load=0.5",
+                                     "--predicate_costs", "at=1e-1"])
+    args = options.parse_args()
+    assert args.prec_cost == 2
+    assert dict(args.action_costs) == {"drive": 3, "load": 0.5}
+    assert dict(args.predicate_costs) == {"at": 0.1}
+    assert options.cost_pair("a=b=2") == ("a=b", 2)
+    with pytest.raises(ValueError):
+        options.cost_pair("drive")
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def test_diagnose_data(hitter):
+    system = System(os.path.join(DATA, "domain.pddl"),
+                    [os.path.join(DATA, "task1.pddl"), os.path.join(DATA, "task2.pddl")],
+                    [os.path.join(DATA, "plan1"), os.path.join(DATA, "plan2")])
+    result = Diagnoser(system, hitter=hitter).search(2)
+    assert result.diagnoses == [{CompPrec("load", Atom("empty", ("?t",))),
+                                 CompEffAdd("drive", Atom("at", ("?t", "?to")))}]
+    assert result.complete
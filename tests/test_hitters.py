@@ -0,0 +1,132 @@
+import itertools
+import random
+
+import pytest
+
+import maxsathitter
+import memhitter
+
+HITTERS = [memhitter.Hitter, maxsathitter.Hitter]
+
+
+def hits(s, conflict):
+    if any(e < 0 and -e not in s for e in conflict):
+        return True
+    return any(e > 0 and e in s for e in conflict)
+
+
+def optimum(n, weights, conflicts):
+    best = None
+    for size in range(n + 1):
+        for s in itertools.combinations(range(1, n + 1), size):
+            if all(hits(s, c) for c in conflicts):
+                w = sum(weights[e] for e in s)
+                if best is None or w < best:
+                    best = w
+    return best
+
+
+def random_instance(seed):
+    rng = random.Random(seed)
+    n = rng.randint(4, 10)
+    weights = [None] + [rng.choice([1, 2, 3, 5]) for _ in range(n)]
+    conflicts = [rng.sample(range(1, n + 1), rng.randint(1, 3)) 
+                 for _ in range(rng.randint(1, 12))]
+    for _ in range(rng.randint(0, 3)):
+        neg = rng.sample(range(1, n + 1), 2)
+        rest = [e for e in range(1, n + 1) if e not in neg]
+        conflicts.append([-neg[0], -neg[1]] + rng.sample(rest, 2))
+    return n, weights, conflicts
+
+
+def solve(hitter, conflicts):
+    '''
+      Adds the conflicts not hit by the top set until it hits all of them, 
+      like the diagnoser does.
+    '''
+    while True:
+        top = hitter.top()
+        if top is None:
+            return None
+        missed = [c for c in conflicts if not hits(top, c)]
+        if not missed:
+            return top
+        hitter.add_conflict(list(missed[0]))
+
+
+@pytest.mark.parametrize("Hitter", HITTERS)
+@pytest.mark.parametrize("seed", range(60))
+def test_optimal_weight(Hitter, seed):
+    n, weights, conflicts = random_instance(seed)
+    hitter = Hitter()
+    hitter.set_weights(weights)
+    top = solve(hitter, conflicts)
+    expected = optimum(n, weights, conflicts)
+    if expected is None:
+        assert top is None
+    else:
+        assert sum(weights[e] for e in top) == expected
+        assert hitter.lower_bound() <= expected
+
+
+@pytest.mark.parametrize("Hitter", HITTERS)
+def test_blocked_sets_are_not_returned(Hitter):
+    hitter = Hitter()
+    hitter.set_weights([None, 1, 1, 2])
+    hitter.add_conflict([1, 2, 3])
+    found = []
+    while len(found) < 3:
+        top = hitter.top()
+        if top is None:
+            break
+        found.append(top)
+        hitter.add_conflict([-e for e in top])
+    assert found == [frozenset({1}), frozenset({2}), frozenset({3})]
+    assert hitter.top() is None
+
+
+@pytest.mark.parametrize("Hitter", HITTERS)
+def test_reset_weights(Hitter):
+    hitter = Hitter()
+    hitter.set_weights([None, 1, 5])
+    hitter.add_conflict([1, 2])
+    assert hitter.top() == frozenset({1})
+    hitter.reset_weights([None, 10, 1])
+    assert hitter.top() == frozenset({2})
+
+
+@pytest.mark.parametrize("Hitter", HITTERS)
+def test_top_n(Hitter):
+    hitter = Hitter()
+    hitter.set_weights([None, 1, 2, 3])
+    hitter.add_conflict([1, 2, 3])
+    tops = hitter.top_n(3)
+    assert tops == [frozenset({1}), frozenset({2}), frozenset({3})]
+    # top_n does not change the next top, nor the lower bound
+    assert hitter.top() == frozenset({1})
+    assert hitter.lower_bound() == 1
+
+
+def test_maxsat_top_is_incremental():
+    hitter = maxsathitter.Hitter()
+    hitter.set_weights([None, 1, 2, 3])
+    hitter.add_conflict([1, 2])
+    hitter.add_conflict([2, 3])
+    nb_nodes = []
+    for _ in range(3):
+        hitter.top_n(1)
+        nb_nodes.append(hitter._nb_nodes)
+    # the search only runs for the first call
+    assert nb_nodes[0] > 0 and nb_nodes[1:] == [nb_nodes[0]] * 2
+    assert hitter.lower_bound() == 2
+
+
+@pytest.mark.parametrize("Hitter", HITTERS)
+def test_many_singleton_conflicts(Hitter):
+    # every element is forced, so the search is as deep as there are conflicts
+    n = 1199
+    hitter = Hitter()
+    for e in range(1, n + 1):
+        hitter.add_conflict([e])
+    assert hitter.top() == frozenset(range(1, n + 1))
+    assert hitter.lower_bound() == n
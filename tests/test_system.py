@@ -0,0 +1,163 @@
+import os
+
+import pytest
+
+from component import CompEffAdd, CompPrec
+from fd.pddl.conditions import Atom
+from system import System
+
+# The domain of tests/data misses the effect (at ?t ?to) of drive and has
+# the extra precondition (empty ?t) in load: the plan of task1 loads a package,
+# drives and unloads it, the plan of task2 drives twice.
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DOMAIN = os.path.join(DATA, "domain.pddl")
+TASKS = [os.path.join(DATA, "task1.pddl"), os.path.join(DATA, "task2.pddl")]
+PLANS = [os.path.join(DATA, "plan1"), os.path.join(DATA, "plan2")]
+
+PREC_EMPTY = CompPrec("load", Atom("empty", ("?t",)))
+PREC_AT_FROM = CompPrec("drive", Atom("at", ("?t", "?from")))
+PREC_AT_UNLOAD = CompPrec("unload", Atom("at", ("?t", "?l")))
+ADD_AT_TO = CompEffAdd("drive", Atom("at", ("?t", "?to")))
+
+EMPTY = set()
+PARTIAL = {PREC_EMPTY}
+DIAGNOSIS = {PREC_EMPTY, ADD_AT_TO}
+
+# the (result, atom, idx) of each task for each candidate
+EXPECTED_INFOS = [
+    (EMPTY, [(False, Atom("empty", ("t0",)), 0), (False, Atom("at", ("t0", "l1")), 1)]),
+    (PARTIAL, [(False, Atom("at", ("t0", "l1")), 2), (False, Atom("at", ("t0", "l1")), 1)]),
+    ({ADD_AT_TO}, [(False, Atom("empty", ("t0",)), 0), (True, None, None)]),
+    (DIAGNOSIS, [(True, None, None), (True, None, None)]),
+]
+
+# the conflicts of the candidates that are not diagnoses,
+# for the first failure of each task
+EXPECTED_CONFLICTS = [
+    (EMPTY, [{PREC_EMPTY}, {PREC_AT_FROM, ADD_AT_TO}]),
+    (PARTIAL, [{PREC_AT_UNLOAD, ADD_AT_TO}, {PREC_AT_FROM, ADD_AT_TO}]),
+    ({ADD_AT_TO}, [{PREC_EMPTY}]),
+]
+
+# and for every failure of each task: the failing steps are applied anyway,
+# so the goal of task2 fails as well
+EXPECTED_ALL_CONFLICTS = [
+    (EMPTY, [{PREC_EMPTY}, {PREC_AT_UNLOAD, ADD_AT_TO},
+             {PREC_AT_FROM, ADD_AT_TO}, {ADD_AT_TO}]),
+    (PARTIAL, [{PREC_AT_UNLOAD, ADD_AT_TO}, {PREC_AT_FROM, ADD_AT_TO}, {ADD_AT_TO}]),
+    ({ADD_AT_TO}, [{PREC_EMPTY}]),
+]
+
+CONFIGS = [
+    {},
+    {"num_workers": 2},
+    # every state is evicted after each batch
+    {"max_states": 1},
+    {"num_workers": 2, "max_states": 1},
+    # every cached result, conflict and repaired action is evicted
+    {"max_cached": 1},
+]
+
+
+def summary(infos):
+    return [(info.result, info.atom, info.idx) for info in infos.infos]
+
+
+@pytest.fixture(params=CONFIGS, ids=str)
+def config(request):
+    return request.param
+
+
+def make_system(config, **kwargs):
+    return System(DOMAIN, TASKS, PLANS, **config, **kwargs)
+
+
+@pytest.fixture
+def system(config):
+    syt = make_system(config)
+    yield syt
+    syt.close()
+
+
+@pytest.fixture
+def system_all_conflicts(config):
+    syt = make_system(config, all_conflicts=True)
+    yield syt
+    syt.close()
+
+
+def test_is_diagnosis(system):
+    # twice, so that the second checks hit the caches (or not, once evicted)
+    for _ in range(2):
+        for candidate, expected in EXPECTED_INFOS:
+            infos = system.is_diagnosis(candidate)
+            assert summary(infos) == expected
+            assert infos.result == all(result for result, _, _ in expected)
+
+
+def test_is_diagnosis_batch(system):
+    candidates = [candidate for candidate, _ in EXPECTED_INFOS]
+    # the same candidate twice in a batch, and the batch twice
+    for _ in range(2):
+        results = system.is_diagnosis_batch(candidates + candidates[:1])
+        assert [summary(infos) for infos in results] == \
+                [expected for _, expected in EXPECTED_INFOS + EXPECTED_INFOS[:1]]
+
+
+def test_find_conflict(system):
+    for _ in range(2):
+        for candidate, expected in EXPECTED_CONFLICTS:
+            infos = system.is_diagnosis(candidate)
+            assert system.find_conflict(candidate, infos) == expected
+
+
+def test_find_conflict_all_conflicts(system_all_conflicts):
+    system = system_all_conflicts
+    for _ in range(2):
+        for candidate, expected in EXPECTED_ALL_CONFLICTS:
+            infos = system.is_diagnosis(candidate)
+            assert system.find_conflict(candidate, infos) == expected
+
+
+def test_max_failures():
+    syt = System(DOMAIN, TASKS, PLANS, max_failures=1)
+    # only task2 fails
+    infos = syt.is_diagnosis({PREC_EMPTY, PREC_AT_UNLOAD})
+    assert summary(infos) == [(True, None, None), (False, Atom("at", ("t0", "l1")), 1)]
+    # task2 failed last, so it is checked first and task1 is not checked
+    infos = syt.is_diagnosis(EMPTY)
+    assert infos.infos[0] is None
+    assert (infos.infos[1].result, infos.infos[1].idx) == (False, 1)
+    assert not infos.result
+
+
+def test_trie_size_is_kept_up_to_date():
+    syt = System(DOMAIN, TASKS, PLANS, max_states=6)
+    candidates = [candidate for candidate, _ in EXPECTED_INFOS]
+    for i in range(4):
+        syt.is_diagnosis_batch(candidates[i:] + candidates[:i])
+        for single in syt._systems:
+            trie = single._trie
+            assert trie._size == sum(len(node.states) + 1 for node in trie._nodes)
+            assert trie._size <= max(3, trie._max_states)
+
+
+def test_project():
+    syt = System(DOMAIN, TASKS, PLANS)
+    task1, task2 = syt._systems
+    # load is not in the plan of task2
+    assert task2._project(PARTIAL) == task2._project(EMPTY)
+    assert task1._project(PARTIAL) != task1._project(EMPTY)
+    assert task2._project(DIAGNOSIS) == task2._project({ADD_AT_TO})
+
+
+def test_matching_add_effs():
+    syt = System(DOMAIN, TASKS, PLANS)
+    task2 = syt._systems[1]
+    action, substitution = task2.substitutions[0]
+    action = task2._get_repaired_action(action, {})
+    # drive t0 l0 l1 can add at(t0, l1) through (at ?t ?to) only
+    assert set(task2._matching_add_effs(action, substitution, Atom("at", ("t0", "l1")))) \
+            == {Atom("at", ("?t", "?to"))}
+    assert set(task2._matching_add_effs(action, substitution, Atom("at", ("t0", "l2")))) \
+            == set()
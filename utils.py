@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 class DGraph:
     def __init__(self, v):
         self.v = v
@@ -36,9 +38,15 @@ class TypeDGraph(DGraph):
             if t.basetype_name:
                 super().add_edge(self.v_map[t.name], 
                                  self.v_map[t.basetype_name]) 
+        # mapping each type to the set of its supertypes, including itself
+        self.supertypes = {}
+        for t in types:
+            self.supertypes[t.name] = {w.name for w in types 
+                                       if self.connected(self.v_map[t.name], 
+                                                         self.v_map[w.name])}
 
     def subtype(self, x, y):
-        return super().connected(self.v_map[x], self.v_map[y])
+        return y in self.supertypes[x]
 
 
 def find_all_tuples(all_combs):
@@ -52,4 +60,55 @@ def find_all_tuples(all_combs):
             t= list(t)
             t.append(e)
             results.add(tuple(t))
-    return results
\ No newline at end of file
+    return results
+
+class LRUCache:
+    def __init__(self, max_size):
+        # the items in the order of their uses, the least recently used 
+        # are evicted once there are more than max_size items
+        self._items = OrderedDict()
+        self.max_size = max_size
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        value = self._items.get(key, default)
+        if key in self._items:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+class AtomTable:
+    def __init__(self):
+        self._ids = {}
+        self._keys = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def id(self, predicate, args):
+        key = (predicate, args)
+        idx = self._ids.get(key)
+        if idx is None:
+            idx = len(self._keys)
+            self._ids[key] = idx
+            self._keys.append(key)
+        return idx
+
+    def key(self, idx):
+        return self._keys[idx]
+
+    def mask(self, predicate, args):
+        return 1 << self.id(predicate, args)
+
+    def state(self, atoms):
+        s = 0
+        for atom in atoms:
+            s |= self.mask(atom.predicate, atom.args)
+        return s